@@ -1,105 +1,104 @@
-import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import pandas as pd
 import streamlit as st
-from config.settings import settings
-import numpy as np
+from services.data_cube import DataCube
+from services.figure_cache import FigureCache
 
 
 class ChartComponents:
+    """Gráficos do dashboard
+
+    Cada gráfico tem um build_*_figure (monta o go.Figure a partir do cubo) e
+    um método que renderiza. Com figure_cache, as figuras são memorizadas por
+    (versão do dataset, gráfico, filtros): reruns que não mudam os dados nem
+    os filtros daquele gráfico reaproveitam a figura já montada.
+    """
+
+    def __init__(self, figure_cache: FigureCache = None):
+        self.figure_cache = figure_cache
+
+    def figure(self, chart_id: str, cache_key: tuple, build):
+        """Figura do cache ou recém-montada; cache_key = (versão, filtros) ou None"""
+        if self.figure_cache is None or cache_key is None:
+            return build()
+        version, filters = cache_key
+        return self.figure_cache.get_or_build((version, chart_id, filters), build)
 
     @staticmethod
-    def sales_funnel_chart(df: pd.DataFrame, selected_seller: str = "Todos"):
+    def build_funnel_figure(cube_filtered: DataCube, title_suffix: str):
+        """Funil na ordem do STATUS_LOOKUP; None se nenhum status do funil aparecer"""
+        # ✅ USAR ORDEM LÓGICA DO FUNIL (posição e cor vêm do STATUS_LOOKUP)
+        status_summary = cube_filtered.status_summary()
+        funnel_data = status_summary[status_summary["order"] >= 0].sort_values(
+            "order")
+
+        if funnel_data.empty:
+            return None
+
+        labels = list(funnel_data.index)
+        values = funnel_data["leads"].tolist()
+        colors = funnel_data["color"].tolist()
+
+        # ✅ CRIAR FUNIL APRIMORADO
+        fig = go.Figure()
+
+        fig.add_trace(go.Funnel(
+            y=labels,
+            x=values,
+            textinfo="value+percent initial+percent previous",
+            texttemplate='%{value}<br>%{percentInitial}<br>(%{percentPrevious} da anterior)',
+            marker=dict(
+                color=colors,
+                line=dict(width=2, color="white")
+            ),
+            connector=dict(
+                line=dict(color="gray", dash="dot", width=2)
+            )
+        ))
+
+        # ✅ LAYOUT APRIMORADO
+        fig.update_layout(
+            title=f"🎯 Funil de Vendas por Status{title_suffix}",
+            height=700,
+            showlegend=False,
+            font=dict(size=12),
+            margin=dict(l=20, r=20, t=60, b=20)
+        )
+        return fig
+
+    def sales_funnel_chart(self, cube: DataCube, selected_seller: str = "Todos", cache_key: tuple = None):
         """Gráfico de funil de vendas aprimorado com filtro por vendedor"""
         try:
-            if df.empty or "status" not in df.columns:
+            if cube.empty:
                 st.warning("Dados insuficientes para gerar o funil de vendas")
                 return
 
             # ✅ APLICAR FILTRO POR VENDEDOR
+            cube_filtered = cube.slice(vendedor=selected_seller)
             if selected_seller != "Todos":
-                df_filtered = df[df["vendedor"] == selected_seller]
                 title_suffix = f" - {selected_seller}"
             else:
-                df_filtered = df.copy()
                 title_suffix = " - Todos os Vendedores"
 
-            if df_filtered.empty:
+            if cube_filtered.empty:
                 st.warning(f"Nenhum dado encontrado para {selected_seller}")
                 return
 
-            # ✅ USAR ORDEM LÓGICA DO FUNIL
-            status_order = settings.LEAD_STATUS
-            status_counts = df_filtered["status"].value_counts()
-
-            # Separar status em categorias para melhor visualização
-            funnel_data = []
-            colors = []
-
-            for i, status in enumerate(status_order):
-                if status in status_counts.index:
-                    count = status_counts[status]
-                    funnel_data.append(
-                        {"status": status, "count": count, "order": i})
-
-                    # ✅ CORES BASEADAS NA CATEGORIA DO STATUS
-                    if status in settings.CONVERSION_STATUS:
-                        colors.append("#4CAF50")  # Verde para vendas
-                    elif status in settings.LOST_STATUS:
-                        colors.append("#F44336")  # Vermelho para perdas
-                    elif status in settings.IN_PROGRESS_STATUS:
-                        colors.append("#2196F3")  # Azul para em progresso
-                    else:
-                        colors.append("#FF9800")  # Laranja para outros
-
-            if not funnel_data:
+            fig = self.figure("funnel", cache_key, lambda: self.build_funnel_figure(
+                cube_filtered, title_suffix))
+
+            if fig is None:
                 st.warning("Nenhum dado de status encontrado")
                 return
 
-            # Ordenar pela ordem do funil
-            funnel_data.sort(key=lambda x: x["order"])
-
-            labels = [item["status"] for item in funnel_data]
-            values = [item["count"] for item in funnel_data]
-
-            # ✅ CRIAR FUNIL APRIMORADO
-            fig = go.Figure()
-
-            fig.add_trace(go.Funnel(
-                y=labels,
-                x=values,
-                textinfo="value+percent initial+percent previous",
-                texttemplate='%{value}<br>%{percentInitial}<br>(%{percentPrevious} da anterior)',
-                marker=dict(
-                    color=colors,
-                    line=dict(width=2, color="white")
-                ),
-                connector=dict(
-                    line=dict(color="gray", dash="dot", width=2)
-                )
-            ))
-
-            # ✅ LAYOUT APRIMORADO
-            fig.update_layout(
-                title=f"🎯 Funil de Vendas por Status{title_suffix}",
-                height=700,
-                showlegend=False,
-                font=dict(size=12),
-                margin=dict(l=20, r=20, t=60, b=20)
-            )
-
             st.plotly_chart(fig, use_container_width=True,
                             key=f"funnel_chart_{selected_seller}")
 
             # ✅ MOSTRAR ESTATÍSTICAS DO FUNIL
-            total_leads = sum(values)
-            conversion_leads = sum(status_counts.get(status, 0)
-                                   for status in settings.CONVERSION_STATUS)
-            lost_leads = sum(status_counts.get(status, 0)
-                             for status in settings.LOST_STATUS)
-            in_progress_leads = sum(status_counts.get(status, 0)
-                                    for status in settings.IN_PROGRESS_STATUS)
+            total_leads = int(sum(fig.data[0].x))
+            funnel_totals = cube_filtered.seller_stats().sum()
+            conversion_leads = int(funnel_totals["vendas"])
+            lost_leads = int(funnel_totals["perdidos"])
+            in_progress_leads = int(funnel_totals["em_progresso"])
 
             col1, col2, col3, col4 = st.columns(4)
             with col1:
@@ -117,70 +116,68 @@ class ChartComponents:
         except Exception as e:
             st.error(f"Erro ao gerar gráfico de funil: {str(e)}")
             # Fallback
-            if not df.empty and "status" in df.columns:
+            if not cube.empty:
                 st.subheader("📊 Distribuição de Status (Tabela)")
-                if selected_seller != "Todos":
-                    df = df[df["vendedor"] == selected_seller]
-                status_counts = df["status"].value_counts()
+                status_counts = cube.slice(
+                    vendedor=selected_seller).status_counts()
                 st.dataframe(status_counts.to_frame("Quantidade"))
 
     @staticmethod
-    def conversion_by_seller_chart(df: pd.DataFrame):
+    def build_conversion_figure(cube: DataCube):
+        """Barras de taxa de conversão por vendedor"""
+        # ✅ CÁLCULO CORRIGIDO - Usar mesma lógica das KPIs
+        seller_stats = cube.seller_stats()
+
+        # Gerar cores baseadas nos valores
+        max_rate = seller_stats["conversion_rate"].max()
+        min_rate = seller_stats["conversion_rate"].min()
+
+        if max_rate > min_rate:
+            normalized_rates = (
+                seller_stats["conversion_rate"] - min_rate) / (max_rate - min_rate)
+        else:
+            normalized_rates = [0.5] * len(seller_stats)
+
+        colors = []
+        for rate in normalized_rates:
+            red = int(255 * (1 - rate))
+            green = int(255 * rate)
+            blue = 50
+            colors.append(f'rgb({red},{green},{blue})')
+
+        fig = go.Figure()
+
+        fig.add_trace(go.Bar(
+            x=seller_stats.index,
+            y=seller_stats["conversion_rate"],
+            text=[f'{rate}%<br>({closed}/{total})' for rate, closed, total in
+                  zip(seller_stats["conversion_rate"], seller_stats["vendas"], seller_stats["total_leads"])],
+            textposition='outside',
+            marker_color=colors,
+            hovertemplate='<b>%{x}</b><br>Taxa: %{y}%<br>Vendas: %{customdata[0]}<br>Total: %{customdata[1]}<extra></extra>',
+            customdata=list(
+                zip(seller_stats["vendas"], seller_stats["total_leads"]))
+        ))
+
+        fig.update_layout(
+            title="📈 Taxa de Conversão por Vendedor",
+            xaxis_title="Vendedor",
+            yaxis_title="Taxa de Conversão (%)",
+            height=400,
+            showlegend=False
+        )
+        return fig
+
+    def conversion_by_seller_chart(self, cube: DataCube, cache_key: tuple = None):
         """Gráfico de conversão por vendedor"""
         try:
-            if df.empty or "vendedor" not in df.columns:
+            if cube.empty:
                 st.warning(
                     "Dados insuficientes para gerar conversão por vendedor")
                 return
 
-            # ✅ CÁLCULO CORRIGIDO - Usar mesma lógica das KPIs
-            seller_stats = df.groupby("vendedor").agg({
-                "lead_id": "count",
-                "status": lambda x: x.isin(settings.CONVERSION_STATUS).sum()
-            }).rename(columns={"lead_id": "total_leads", "status": "fechados"})
-
-            seller_stats["conversion_rate"] = (
-                seller_stats["fechados"] / seller_stats["total_leads"] * 100
-            ).round(2)
-
-            # Gerar cores baseadas nos valores
-            max_rate = seller_stats["conversion_rate"].max()
-            min_rate = seller_stats["conversion_rate"].min()
-
-            if max_rate > min_rate:
-                normalized_rates = (
-                    seller_stats["conversion_rate"] - min_rate) / (max_rate - min_rate)
-            else:
-                normalized_rates = [0.5] * len(seller_stats)
-
-            colors = []
-            for rate in normalized_rates:
-                red = int(255 * (1 - rate))
-                green = int(255 * rate)
-                blue = 50
-                colors.append(f'rgb({red},{green},{blue})')
-
-            fig = go.Figure()
-
-            fig.add_trace(go.Bar(
-                x=seller_stats.index,
-                y=seller_stats["conversion_rate"],
-                text=[f'{rate}%<br>({closed}/{total})' for rate, closed, total in
-                      zip(seller_stats["conversion_rate"], seller_stats["fechados"], seller_stats["total_leads"])],
-                textposition='outside',
-                marker_color=colors,
-                hovertemplate='<b>%{x}</b><br>Taxa: %{y}%<br>Vendas: %{customdata[0]}<br>Total: %{customdata[1]}<extra></extra>',
-                customdata=list(
-                    zip(seller_stats["fechados"], seller_stats["total_leads"]))
-            ))
-
-            fig.update_layout(
-                title="📈 Taxa de Conversão por Vendedor",
-                xaxis_title="Vendedor",
-                yaxis_title="Taxa de Conversão (%)",
-                height=400,
-                showlegend=False
-            )
+            fig = self.figure("conversion", cache_key,
+                              lambda: self.build_conversion_figure(cube))
 
             st.plotly_chart(fig, use_container_width=True,
                             key="conversion_chart")
@@ -189,44 +186,39 @@ class ChartComponents:
             st.error(f"Erro ao gerar gráfico de conversão: {str(e)}")
 
     @staticmethod
-    def status_distribution_chart(df: pd.DataFrame):
+    def build_status_figure(cube: DataCube):
+        """Pizza de leads por status"""
+        status_summary = cube.status_summary()
+
+        fig = go.Figure()
+
+        fig.add_trace(go.Pie(
+            labels=status_summary.index,
+            values=status_summary["leads"].values,
+            hole=0.4,
+            # ✅ CORES BASEADAS NA CATEGORIA
+            marker=dict(colors=status_summary["color"].tolist()),
+            textinfo='label+value+percent',
+            textposition='auto'
+        ))
+
+        fig.update_layout(
+            title="📊 Distribuição de Leads por Status",
+            height=400,
+            showlegend=True,
+            legend=dict(orientation="v", yanchor="middle", y=0.5)
+        )
+        return fig
+
+    def status_distribution_chart(self, cube: DataCube, cache_key: tuple = None):
         """Gráfico de distribuição de status"""
         try:
-            if df.empty or "status" not in df.columns:
+            if cube.empty:
                 st.warning("Dados de status não disponíveis")
                 return
 
-            status_counts = df["status"].value_counts()
-
-            # ✅ CORES BASEADAS NA CATEGORIA
-            colors = []
-            for status in status_counts.index:
-                if status in settings.CONVERSION_STATUS:
-                    colors.append("#4CAF50")  # Verde
-                elif status in settings.LOST_STATUS:
-                    colors.append("#F44336")  # Vermelho
-                elif status in settings.IN_PROGRESS_STATUS:
-                    colors.append("#2196F3")  # Azul
-                else:
-                    colors.append("#FF9800")  # Laranja
-
-            fig = go.Figure()
-
-            fig.add_trace(go.Pie(
-                labels=status_counts.index,
-                values=status_counts.values,
-                hole=0.4,
-                marker=dict(colors=colors),
-                textinfo='label+value+percent',
-                textposition='auto'
-            ))
-
-            fig.update_layout(
-                title="📊 Distribuição de Leads por Status",
-                height=400,
-                showlegend=True,
-                legend=dict(orientation="v", yanchor="middle", y=0.5)
-            )
+            fig = self.figure("status", cache_key,
+                              lambda: self.build_status_figure(cube))
 
             st.plotly_chart(fig, use_container_width=True,
                             key="status_pie_chart")
@@ -235,38 +227,41 @@ class ChartComponents:
             st.error(f"Erro ao gerar gráfico de distribuição: {str(e)}")
 
     @staticmethod
-    def leads_timeline_chart(df: pd.DataFrame):
+    def build_timeline_figure(cube: DataCube):
+        """Linha de leads criados por dia"""
+        daily_leads = cube.daily_counts().reset_index(name="count")
+        daily_leads["created_date"] = daily_leads["created_date"].dt.date
+
+        fig = go.Figure()
+
+        fig.add_trace(go.Scatter(
+            x=daily_leads["created_date"],
+            y=daily_leads["count"],
+            mode='lines+markers',
+            name='Leads por dia',
+            line=dict(color='#45B7D1', width=2),
+            marker=dict(color='#FF6B6B', size=6),
+            fill='tonexty'
+        ))
+
+        fig.update_layout(
+            title="📅 Leads Criados ao Longo do Tempo",
+            xaxis_title="Data",
+            yaxis_title="Número de Leads",
+            height=400,
+            showlegend=False
+        )
+        return fig
+
+    def leads_timeline_chart(self, cube: DataCube, cache_key: tuple = None):
         """Gráfico de timeline de leads"""
         try:
-            if df.empty or "created_time" not in df.columns:
+            if cube.empty:
                 st.warning("Dados de timeline não disponíveis")
                 return
 
-            df_copy = df.copy()
-            df_copy["created_date"] = pd.to_datetime(
-                df_copy["created_time"]).dt.date
-            daily_leads = df_copy.groupby(
-                "created_date").size().reset_index(name="count")
-
-            fig = go.Figure()
-
-            fig.add_trace(go.Scatter(
-                x=daily_leads["created_date"],
-                y=daily_leads["count"],
-                mode='lines+markers',
-                name='Leads por dia',
-                line=dict(color='#45B7D1', width=2),
-                marker=dict(color='#FF6B6B', size=6),
-                fill='tonexty'
-            ))
-
-            fig.update_layout(
-                title="📅 Leads Criados ao Longo do Tempo",
-                xaxis_title="Data",
-                yaxis_title="Número de Leads",
-                height=400,
-                showlegend=False
-            )
+            fig = self.figure("timeline", cache_key,
+                              lambda: self.build_timeline_figure(cube))
 
             st.plotly_chart(fig, use_container_width=True,
                             key="timeline_chart")
@@ -275,61 +270,58 @@ class ChartComponents:
             st.error(f"Erro ao gerar gráfico de timeline: {str(e)}")
 
     @staticmethod
-    def seller_performance_chart(df: pd.DataFrame):
+    def build_performance_figure(cube: DataCube):
+        """Barras de total/vendas/perdidos por vendedor"""
+        # ✅ CÁLCULO CORRIGIDO - Usar mesma lógica das KPIs
+        seller_stats = cube.seller_stats().reset_index()
+
+        fig = go.Figure()
+
+        fig.add_trace(go.Bar(
+            name='Total Leads',
+            x=seller_stats["vendedor"],
+            y=seller_stats["total_leads"],
+            marker_color='#45B7D1',
+            text=seller_stats["total_leads"],
+            textposition='inside'
+        ))
+
+        fig.add_trace(go.Bar(
+            name='Vendas',
+            x=seller_stats["vendedor"],
+            y=seller_stats["vendas"],
+            marker_color='#4CAF50',
+            text=seller_stats["vendas"],
+            textposition='inside'
+        ))
+
+        fig.add_trace(go.Bar(
+            name='Perdidos',
+            x=seller_stats["vendedor"],
+            y=seller_stats["perdidos"],
+            marker_color='#F44336',
+            text=seller_stats["perdidos"],
+            textposition='inside'
+        ))
+
+        fig.update_layout(
+            title="📊 Performance por Vendedor",
+            xaxis_title="Vendedor",
+            yaxis_title="Quantidade",
+            barmode='group',
+            height=400
+        )
+        return fig
+
+    def seller_performance_chart(self, cube: DataCube, cache_key: tuple = None):
         """Gráfico de performance por vendedor"""
         try:
-            if df.empty or "vendedor" not in df.columns:
+            if cube.empty:
                 st.warning("Dados insuficientes para análise de performance")
                 return
 
-            # ✅ CÁLCULO CORRIGIDO - Usar mesma lógica das KPIs
-            seller_stats = df.groupby("vendedor").agg({
-                "lead_id": "count",
-                "status": [
-                    lambda x: x.isin(settings.CONVERSION_STATUS).sum(),
-                    lambda x: x.isin(settings.LOST_STATUS).sum()
-                ]
-            }).round(2)
-
-            seller_stats.columns = ["total_leads", "vendas", "perdidos"]
-            seller_stats = seller_stats.reset_index()
-
-            fig = go.Figure()
-
-            fig.add_trace(go.Bar(
-                name='Total Leads',
-                x=seller_stats["vendedor"],
-                y=seller_stats["total_leads"],
-                marker_color='#45B7D1',
-                text=seller_stats["total_leads"],
-                textposition='inside'
-            ))
-
-            fig.add_trace(go.Bar(
-                name='Vendas',
-                x=seller_stats["vendedor"],
-                y=seller_stats["vendas"],
-                marker_color='#4CAF50',
-                text=seller_stats["vendas"],
-                textposition='inside'
-            ))
-
-            fig.add_trace(go.Bar(
-                name='Perdidos',
-                x=seller_stats["vendedor"],
-                y=seller_stats["perdidos"],
-                marker_color='#F44336',
-                text=seller_stats["perdidos"],
-                textposition='inside'
-            ))
-
-            fig.update_layout(
-                title="📊 Performance por Vendedor",
-                xaxis_title="Vendedor",
-                yaxis_title="Quantidade",
-                barmode='group',
-                height=400
-            )
+            fig = self.figure("performance", cache_key,
+                              lambda: self.build_performance_figure(cube))
 
             st.plotly_chart(fig, use_container_width=True,
                             key="performance_chart")
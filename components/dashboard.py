@@ -1,27 +1,74 @@
+import time
 import streamlit as st
 import pandas as pd
+from datetime import date, timedelta
 from components.charts import ChartComponents
+from config.settings import settings
+from services.data_cube import DataCube
 from services.data_processor import DataProcessor
+from services.dataset import LeadDataset
+from services.dataset_store import DatasetStore
+from services.figure_cache import FigureCache
+from services.refresh_worker import RefreshWorker
+
+
+# Filtros que entram na chave do cache de figuras de cada seção (o funil não
+# usa o período). Não controlam quando a seção roda de novo: isso depende só
+# de onde ficam os widgets (ver render_period_section)
+SECTION_DEPENDENCIES = {
+    "funnel": ("vendedor",),
+    "period": ("vendedor", "date_range"),
+}
+
+
+@st.cache_resource
+def get_data_processor() -> DataProcessor:
+    """DataProcessor único por processo: guarda o estado da sincronização incremental"""
+    return DataProcessor()
+
+
+@st.cache_resource
+def get_dataset_store() -> DatasetStore:
+    """Dataset compartilhado por todas as sessões (sem cópias por sessão)"""
+    return DatasetStore()
+
+
+@st.cache_resource
+def get_figure_cache() -> FigureCache:
+    """Figuras Plotly memorizadas por (versão, gráfico, filtros), para todas as sessões"""
+    return FigureCache()
+
+
+@st.cache_resource
+def get_refresh_worker() -> RefreshWorker:
+    """Thread única que atualiza o dataset compartilhado em segundo plano"""
+    data_processor = get_data_processor()
+    worker = RefreshWorker(
+        get_dataset_store(),
+        lambda: LeadDataset.from_frame(data_processor.get_all_sales_data(
+            incremental=settings.INCREMENTAL_SYNC)),
+        settings.BACKGROUND_REFRESH_MINUTES * 60
+    )
+    worker.start()
+    return worker
 
 
 class Dashboard:
     def __init__(self):
-        self.data_processor = DataProcessor()
-        self.charts = ChartComponents()
+        self.data_processor = get_data_processor()
+        self.dataset_store = get_dataset_store()
+        self.charts = ChartComponents(get_figure_cache())
 
     def render_sidebar(self):
         """Renderiza a barra lateral com filtros"""
         st.sidebar.header("🔍 Filtros")
 
-        # ✅ USAR SESSION STATE PARA EVITAR DUPLICAÇÃO
-        if 'df_loaded' not in st.session_state:
-            st.session_state.df_loaded = None
-
-        # Carregar dados para filtros apenas se necessário
-        if st.session_state.df_loaded is None:
-            st.session_state.df_loaded = self.load_data()
+        if settings.FILTER_PUSHDOWN:
+            return self.render_pushdown_sidebar()
 
-        df = st.session_state.df_loaded
+        # ✅ DATASET COMPARTILHADO: carregado uma vez por processo
+        dataset = self.load_data()
+        df = dataset.leads
         filters = {}
 
         if not df.empty:
@@ -34,58 +81,93 @@ class Dashboard:
             )
             filters["vendedor"] = selected_seller
 
-            # ✅ FILTRO POR PERÍODO (opcional)
-            if "created_time" in df.columns:
-                df_copy = df.copy()
-                df_copy["created_date"] = pd.to_datetime(
-                    df_copy["created_time"]).dt.date
+            # O filtro por período fica na seção de período (fragmento), para
+            # que mudar as datas não rode de novo o funil e o resto da página
+
+        # Botão para atualizar dados (em segundo plano; a versão atual segue no ar)
+        refresh_worker = get_refresh_worker()
+        if st.sidebar.button("🔄 Atualizar Dados", type="primary", key="refresh_button"):
+            refresh_worker.request_refresh()
+
+        # Atualização parcial: só os databases do vendedor selecionado
+        selected_seller = filters.get("vendedor", "Todos")
+        if selected_seller != "Todos" and st.sidebar.button(
+                f"♻️ Atualizar só {selected_seller}", key="refresh_seller_button"):
+            with st.spinner(f"Atualizando dados de {selected_seller}..."):
+                try:
+                    self.refresh_seller(selected_seller)
+                    st.rerun()
+                except ValueError as e:
+                    st.sidebar.warning(f"⚠️ {e}")
+
+        self.render_refresh_status(dataset, refresh_worker)
 
-                min_date = df_copy["created_date"].min()
-                max_date = df_copy["created_date"].max()
+        return filters
 
-                if min_date and max_date:
-                    date_range = st.sidebar.date_input(
-                        "📅 Período",
-                        value=(min_date, max_date),
-                        min_value=min_date,
-                        max_value=max_date,
-                        key="main_date_filter"  # ✅ Key única
-                    )
+    @staticmethod
+    def format_age(seconds: float) -> str:
+        """Idade dos dados em texto curto"""
+        minutes = int(seconds // 60)
+        if minutes < 1:
+            return "menos de 1 min"
+        if minutes < 60:
+            return f"{minutes} min"
+        return f"{minutes // 60}h{minutes % 60:02d}"
+
+    def render_refresh_status(self, dataset: LeadDataset, refresh_worker: RefreshWorker):
+        """Idade dos dados e situação da atualização em segundo plano"""
+        status = refresh_worker.status()
+
+        st.sidebar.caption(
+            f"🕒 Dados de {self.format_age(time.time() - dataset.synced_at)} atrás (versão {dataset.version})")
+
+        if status["running"] or status["queued"]:
+            st.sidebar.info(
+                "🔄 Atualização em andamento; os gráficos mudam para a nova versão ao concluir")
+        elif status["last_error"]:
+            st.sidebar.warning(
+                f"⚠️ Última atualização falhou: {status['last_error']}")
+
+    def render_pushdown_sidebar(self):
+        """Filtros do modo pushdown: montados sem baixar os leads do workspace"""
+        filters = {}
 
-                    if len(date_range) == 2:
-                        filters["date_range"] = date_range
+        vendedores = ["Todos"] + self.load_sellers()
+        filters["vendedor"] = st.sidebar.selectbox(
+            "👤 Selecionar Vendedor",
+            vendedores,
+            key="main_seller_filter"
+        )
+
+        today = date.today()
+        default_range = (
+            today - timedelta(days=settings.PUSHDOWN_DEFAULT_DAYS), today)
+        date_range = st.sidebar.date_input(
+            "📅 Período",
+            value=default_range,
+            max_value=today,
+            key="main_date_filter"
+        )
+        # Enquanto a data final não é escolhida o seletor devolve só a inicial:
+        # seguir com o último período completo em vez de consultar o
+        # workspace inteiro sem filtro de datas
+        if len(date_range) == 2:
+            st.session_state["pushdown_date_range"] = tuple(date_range)
+        filters["date_range"] = st.session_state.get(
+            "pushdown_date_range", default_range)
 
-        # Botão para atualizar dados
         if st.sidebar.button("🔄 Atualizar Dados", type="primary", key="refresh_button"):
             st.cache_data.clear()
-            st.session_state.df_loaded = None  # ✅ Limpar session state
             st.rerun()
 
         return filters
 
-    def apply_filters(self, df: pd.DataFrame, filters: dict) -> pd.DataFrame:
-        """Aplica filtros ao DataFrame"""
-        if df.empty:
-            return df
+    def apply_filters(self, dataset: LeadDataset, filters: dict) -> pd.DataFrame:
+        """Aplica filtros ao dataset usando os índices do FilterEngine"""
+        if dataset.empty:
+            return dataset.leads
 
-        filtered_df = df.copy()
-
-        # Filtro por vendedor
-        if filters.get("vendedor") and filters["vendedor"] != "Todos":
-            filtered_df = filtered_df[filtered_df["vendedor"]
-                                      == filters["vendedor"]]
-
-        # Filtro por data
-        if filters.get("date_range") and len(filters["date_range"]) == 2:
-            filtered_df["created_date"] = pd.to_datetime(
-                filtered_df["created_time"]).dt.date
-            start_date, end_date = filters["date_range"]
-            filtered_df = filtered_df[
-                (filtered_df["created_date"] >= start_date) &
-                (filtered_df["created_date"] <= end_date)
-            ]
-
-        return filtered_df
+        return dataset.filter(filters.get("vendedor"), filters.get("date_range"))
 
     def render_metrics_cards(self, metrics: dict):
         """Renderiza cards de métricas"""
@@ -115,28 +197,25 @@ class Dashboard:
                 value=metrics.get("leads_perdidos", 0)
             )
 
-    def render_data_quality_info(self, df: pd.DataFrame):
+    def render_data_quality_info(self, cube: DataCube):
         """Renderiza informações sobre qualidade dos dados"""
-        if df.empty:
+        if cube.empty:
             return
 
         st.subheader("📊 Resumo dos Dados")
 
+        totals = cube.totals()
+
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            leads_com_nome = len(df[df["nome"].notna() & (df["nome"] != "")])
-            st.metric("👤 Leads com Nome", leads_com_nome)
+            st.metric("👤 Leads com Nome", totals["com_nome"])
 
         with col2:
-            leads_com_telefone = len(
-                df[df["telefone"].notna() & (df["telefone"] != "")])
-            st.metric("📞 Leads com Telefone", leads_com_telefone)
+            st.metric("📞 Leads com Telefone", totals["com_telefone"])
 
         with col3:
-            leads_com_status = len(
-                df[df["status"].notna() & (df["status"] != "")])
-            st.metric("📋 Leads com Status", leads_com_status)
+            st.metric("📋 Leads com Status", totals["com_status"])
 
     def render_main_dashboard(self):
         """Renderiza o dashboard principal"""
@@ -147,10 +226,14 @@ class Dashboard:
 
         # Carregar dados originais
         with st.spinner("Carregando dados do Notion..."):
-            if 'df_loaded' not in st.session_state or st.session_state.df_loaded is None:
-                st.session_state.df_loaded = self.load_data()
+            if settings.FILTER_PUSHDOWN:
+                # ✅ PUSHDOWN: o Notion já devolve só o vendedor/período selecionado
+                dataset = self.load_filtered_data(
+                    filters.get("vendedor"), filters.get("date_range"))
+            else:
+                dataset = self.load_data()
 
-            df_original = st.session_state.df_loaded
+            df_original = dataset.leads
 
         if df_original.empty:
             st.error("❌ Nenhum dado encontrado. Verifique:")
@@ -159,8 +242,74 @@ class Dashboard:
             st.info("• Se as colunas estão nomeadas corretamente")
             return
 
-        # Aplicar filtros
-        df = self.apply_filters(df_original, filters)
+        selected_seller = filters.get("vendedor", "Todos")
+
+        # ✅ SEÇÕES: o funil roda com a página; a seção de período é um
+        # fragmento, então mudar as datas roda de novo só ela
+        self.render_funnel_section(dataset, selected_seller)
+
+        st.divider()
+
+        # No modo pushdown o recorte não fica no DatasetStore e vai pronto
+        self.render_period_section(
+            filters, dataset if settings.FILTER_PUSHDOWN else None)
+
+    def section_key(self, section: str, dataset: LeadDataset, filters: dict):
+        """Chave do cache de figuras da seção: versão + valores dos filtros de que depende
+
+        Só versões publicadas no DatasetStore são memorizadas (no modo
+        pushdown cada carga é um dataset avulso, com version 0).
+        """
+        if not dataset.version:
+            return None
+        return (dataset.version, tuple(filters.get(name) for name in SECTION_DEPENDENCIES[section]))
+
+    def render_funnel_section(self, dataset: LeadDataset, selected_seller: str):
+        """Funil do vendedor selecionado (todo o período)"""
+        filters = {"vendedor": selected_seller}
+        self.charts.sales_funnel_chart(
+            dataset.cube, selected_seller, self.section_key("funnel", dataset, filters))
+
+    def section_dataset(self, pushdown_dataset: LeadDataset = None) -> LeadDataset:
+        """Dataset usado por um fragmento, lido a cada execução dele
+
+        Um fragmento roda de novo sozinho com os argumentos da última execução
+        da página; lendo a versão publicada aqui, ele não continua mostrando
+        uma versão antiga depois de uma atualização em segundo plano.
+        """
+        if pushdown_dataset is not None:
+            return pushdown_dataset
+
+        dataset = self.dataset_store.current()
+        return dataset if dataset is not None else self.load_data()
+
+    @st.fragment
+    def render_period_section(self, filters: dict, pushdown_dataset: LeadDataset = None):
+        """Seletor de período e tudo que depende dele: métricas, gráficos e tabela
+
+        Mudar o período roda de novo só este fragmento. pushdown_dataset é o
+        recorte do modo pushdown (load_filtered_data); fora dele o dataset vem
+        do DatasetStore.
+        """
+        dataset = self.section_dataset(pushdown_dataset)
+        filters = dict(filters)
+
+        # ✅ FILTRO POR PERÍODO (opcional) - limites calculados na carga
+        if not settings.FILTER_PUSHDOWN and dataset.min_date and dataset.max_date:
+            date_range = st.date_input(
+                "📅 Período",
+                value=(dataset.min_date, dataset.max_date),
+                min_value=dataset.min_date,
+                max_value=dataset.max_date,
+                key="main_date_filter"  # ✅ Key única
+            )
+
+            if len(date_range) == 2:
+                filters["date_range"] = date_range
+
+        # Recorte do cubo para os filtros atuais (gráficos e métricas)
+        cube = dataset.cube.slice(
+            filters.get("vendedor"), filters.get("date_range"))
 
         # Mostrar informações
         """if filters.get("vendedor") and filters["vendedor"] != "Todos":
@@ -170,10 +319,10 @@ class Dashboard:
             st.success(f"✅ {len(df)} leads carregados com sucesso!")"""
 
         # Informações sobre qualidade dos dados
-        self.render_data_quality_info(df)
+        self.render_data_quality_info(cube)
 
         # Calcular métricas
-        metrics = self.data_processor.calculate_conversion_metrics(df)
+        metrics = self.data_processor.calculate_conversion_metrics(cube)
 
         # Renderizar cards de métricas
         self.render_metrics_cards(metrics)
@@ -181,32 +330,74 @@ class Dashboard:
         st.divider()
 
         # ✅ GRÁFICOS COM FILTROS APLICADOS
+        chart_key = self.section_key("period", dataset, filters)
+
         col1, col2 = st.columns(2)
 
         with col1:
-            # Passar vendedor selecionado para o funil
-            selected_seller = filters.get("vendedor", "Todos")
-            self.charts.sales_funnel_chart(df_original, selected_seller)
+            self.charts.conversion_by_seller_chart(cube, chart_key)
 
         with col2:
-            self.charts.conversion_by_seller_chart(df)
+            self.charts.seller_performance_chart(cube, chart_key)
 
         col3, col4 = st.columns(2)
 
         with col3:
-            self.charts.status_distribution_chart(df)
+            self.charts.status_distribution_chart(cube, chart_key)
 
         with col4:
-            self.charts.seller_performance_chart(df)
-
-        # Timeline
-        self.charts.leads_timeline_chart(df)
+            self.charts.leads_timeline_chart(cube, chart_key)
 
         # Tabela de dados detalhados
         with st.expander("📋 Dados Detalhados"):
+            df = self.apply_filters(dataset, filters)
+            if not dataset.extra_properties.empty:
+                # Propriedades originais (prop_*) só entram na tabela detalhada
+                df = df.join(dataset.extra_properties)
             st.dataframe(df, use_container_width=True)
 
+    def refresh_seller(self, vendedor: str) -> LeadDataset:
+        """Recarrega só os databases do vendedor e publica a nova versão"""
+        def fetch() -> LeadDataset:
+            dataset = LeadDataset.from_frame(
+                self.data_processor.refresh_databases(vendedor=vendedor))
+            # Os outros vendedores continuam com os dados da versão anterior
+            current = self.dataset_store.current()
+            if current is not None:
+                dataset.synced_at = current.synced_at
+            return dataset
+
+        return self.dataset_store.refresh_partial(("vendedor", vendedor), fetch)
+
+    def load_data(self) -> LeadDataset:
+        """Dataset atual do processo (carregado na primeira chamada)"""
+        return self.dataset_store.get(self.fetch_dataset)
+
+    def fetch_dataset(self) -> LeadDataset:
+        """Carrega dados do Notion
+
+        Ao iniciar o processo, serve o último snapshot em disco (se ainda
+        estiver dentro de SNAPSHOT_MAX_AGE_HOURS). As cargas seguintes são
+        feitas pelo RefreshWorker e sincronizam apenas as entradas alteradas
+        (INCREMENTAL_SYNC).
+        """
+        if not self.data_processor.snapshot_checked:
+            snapshot_df = self.data_processor.load_snapshot()
+            if snapshot_df is not None:
+                dataset = LeadDataset.from_frame(snapshot_df)
+                dataset.synced_at = self.data_processor.snapshot_saved_at or dataset.synced_at
+                return dataset
+
+        return LeadDataset.from_frame(self.data_processor.get_all_sales_data(
+            incremental=settings.INCREMENTAL_SYNC))
+
+    @st.cache_data
+    def load_filtered_data(_self, vendedor: str, date_range: tuple) -> LeadDataset:
+        """Carrega do Notion apenas o vendedor/período selecionado (modo pushdown)"""
+        return LeadDataset.from_frame(
+            _self.data_processor.get_filtered_sales_data(vendedor, date_range))
+
     @st.cache_data
-    def load_data(_self) -> pd.DataFrame:
-        """Carrega dados do Notion com cache"""
-        return _self.data_processor.get_all_sales_data()
+    def load_sellers(_self) -> list:
+        """Lista de vendedores para o filtro do modo pushdown"""
+        return _self.data_processor.list_sellers()
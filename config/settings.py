@@ -1,9 +1,39 @@
 import os
+from typing import Dict, List, NamedTuple, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
+class StatusInfo(NamedTuple):
+    """Classificação de um status: categoria, posição no funil e cor"""
+    category: int
+    order: int
+    color: str
+
+
+def compile_status_lookup(lead_status: List[str],
+                          categories: List[Tuple[int, List[str]]],
+                          colors: Dict[int, str],
+                          default_category: int) -> Dict[str, StatusInfo]:
+    """Monta o mapa status -> StatusInfo uma única vez
+
+    categories vem em ordem de precedência (a primeira lista que contém o
+    status define a categoria). Status fora do funil ficam com order -1.
+    """
+    lookup = {}
+    statuses = list(lead_status) + [
+        status for _, members in categories for status in members]
+    for status in statuses:
+        if status in lookup:
+            continue
+        category = next(
+            (code for code, members in categories if status in members), default_category)
+        order = lead_status.index(status) if status in lead_status else -1
+        lookup[status] = StatusInfo(category, order, colors[category])
+    return lookup
+
+
 class Settings:
     NOTION_TOKEN = os.getenv("NOTION_TOKEN")
     WORKSPACE_ID = os.getenv("WORKSPACE_ID")
@@ -61,6 +91,34 @@ class Settings:
         "AGUARDANDO FICHA"
     ]
 
+    # ✅ CATEGORIAS DE STATUS (coluna status_category, int8, da tabela de leads)
+    STATUS_CATEGORY_OTHER = 0
+    STATUS_CATEGORY_CONVERSION = 1
+    STATUS_CATEGORY_LOST = 2
+    STATUS_CATEGORY_IN_PROGRESS = 3
+
+    STATUS_CATEGORY_COLORS = {
+        STATUS_CATEGORY_OTHER: "#FF9800",        # Laranja para outros
+        STATUS_CATEGORY_CONVERSION: "#4CAF50",   # Verde para vendas
+        STATUS_CATEGORY_LOST: "#F44336",         # Vermelho para perdas
+        STATUS_CATEGORY_IN_PROGRESS: "#2196F3",  # Azul para em progresso
+    }
+
+    # status -> (categoria, posição no funil, cor), compilado uma vez
+    STATUS_LOOKUP = compile_status_lookup(
+        LEAD_STATUS,
+        [
+            (STATUS_CATEGORY_CONVERSION, CONVERSION_STATUS),
+            (STATUS_CATEGORY_LOST, LOST_STATUS),
+            (STATUS_CATEGORY_IN_PROGRESS, IN_PROGRESS_STATUS),
+        ],
+        STATUS_CATEGORY_COLORS,
+        STATUS_CATEGORY_OTHER
+    )
+    # Status vazio ou desconhecido (fora de todas as listas)
+    STATUS_UNKNOWN = StatusInfo(
+        STATUS_CATEGORY_OTHER, -1, STATUS_CATEGORY_COLORS[STATUS_CATEGORY_OTHER])
+
     # ✅ CONFIGURAÇÕES DE FILTROS
     EXCLUDED_PAGES = [
         "CRM ANA LUÍSA NEVES (1)",
@@ -71,5 +129,55 @@ class Settings:
     MIN_CONTACT_DATA_PERCENTAGE = 30
     MIN_LEADS_FOR_LOW_QUALITY = 50
 
+    # ✅ CONFIGURAÇÕES DE COLETA NO NOTION
+    # Limite da API do Notion: ~3 requisições por segundo por integração
+    NOTION_REQUESTS_PER_SECOND = float(
+        os.getenv("NOTION_REQUESTS_PER_SECOND", "3"))
+    # Databases processados em paralelo (1 = modo sequencial)
+    NOTION_MAX_WORKERS = int(os.getenv("NOTION_MAX_WORKERS", "4"))
+    # Conexões HTTP mantidas no pool do cliente assíncrono
+    NOTION_MAX_CONNECTIONS = int(os.getenv("NOTION_MAX_CONNECTIONS", "10"))
+    # Retentativas para 429/5xx/timeouts (Retry-After ou backoff exponencial)
+    NOTION_MAX_RETRIES = int(os.getenv("NOTION_MAX_RETRIES", "5"))
+    NOTION_RETRY_BASE_DELAY = float(os.getenv("NOTION_RETRY_BASE_DELAY", "1"))
+    NOTION_RETRY_MAX_DELAY = float(os.getenv("NOTION_RETRY_MAX_DELAY", "30"))
+    # "Atualizar Dados" busca apenas entradas editadas desde a última carga
+    INCREMENTAL_SYNC = os.getenv("INCREMENTAL_SYNC", "true").lower() == "true"
+    # Carga completa periódica: a consulta incremental não traz entradas
+    # arquivadas/excluídas, que só saem numa carga completa; 0 desliga
+    FULL_SYNC_HOURS = float(os.getenv("FULL_SYNC_HOURS", "24"))
+    # Atualização em segundo plano (as sessões seguem com a versão atual até a
+    # nova ficar pronta); 0 desliga a periódica, mantendo a do botão
+    BACKGROUND_REFRESH_MINUTES = float(
+        os.getenv("BACKGROUND_REFRESH_MINUTES", "15"))
+
+    # Manter todas as propriedades do Notion como colunas prop_* (desliga a
+    # projeção via filter_properties, que busca só nome/telefone/curso/status/data)
+    INCLUDE_RAW_PROPERTIES = os.getenv(
+        "INCLUDE_RAW_PROPERTIES", "false").lower() == "true"
+    # Filtros do dashboard aplicados na própria query do Notion (vendedor/período)
+    FILTER_PUSHDOWN = os.getenv("FILTER_PUSHDOWN", "false").lower() == "true"
+    # Período padrão do filtro de datas no modo pushdown
+    PUSHDOWN_DEFAULT_DAYS = int(os.getenv("PUSHDOWN_DEFAULT_DAYS", "30"))
+
+    # ✅ SNAPSHOTS EM DISCO (servidos imediatamente ao iniciar o app)
+    SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "true").lower() == "true"
+    SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", ".snapshots")
+    SNAPSHOT_MAX_AGE_HOURS = float(os.getenv("SNAPSHOT_MAX_AGE_HOURS", "24"))
+
+    # ✅ CACHE DE FIGURAS PLOTLY (por versão do dataset, gráfico e filtros)
+    FIGURE_CACHE_MAX_ENTRIES = int(os.getenv("FIGURE_CACHE_MAX_ENTRIES", "200"))
+    FIGURE_CACHE_MAX_MB = float(os.getenv("FIGURE_CACHE_MAX_MB", "64"))
+
+    # ✅ CACHE DE NOMES DE VENDEDORES (título da página pai de cada CRM)
+    SELLER_NAME_CACHE_PATH = os.getenv(
+        "SELLER_NAME_CACHE_PATH", os.path.join(SNAPSHOT_DIR, "seller_names.json"))
+    # Validade de um título quando a verificação de páginas editadas falha
+    SELLER_NAME_TTL_HOURS = float(os.getenv("SELLER_NAME_TTL_HOURS", "24"))
+    # Limite da busca por páginas editadas (de 100 resultados cada); acima
+    # disso as páginas dos vendedores são consultadas de novo
+    SELLER_NAME_SCAN_MAX_PAGES = int(
+        os.getenv("SELLER_NAME_SCAN_MAX_PAGES", "3"))
+
 
 settings = Settings()
@@ -0,0 +1,119 @@
+import pandas as pd
+from typing import Dict
+from config.settings import settings
+
+# Dimensões do cubo (uma linha por combinação presente nos dados);
+# status_category depende só do status, então não cria células novas
+CUBE_DIMENSIONS = ["vendedor", "status", "status_category", "created_date"]
+
+# Medidas somáveis de cada célula
+CUBE_MEASURES = ["leads", "com_nome", "com_telefone", "com_status"]
+
+
+class DataCube:
+    """Contagens de leads pré-agregadas por vendedor × status × dia
+
+    Montado uma vez por versão dos dados. Os gráficos e os cards de métricas
+    consultam só as células, então o custo de cada interação depende do
+    número de vendedores e de dias, e não do número de leads.
+    """
+
+    def __init__(self, cells: pd.DataFrame):
+        self.cells = cells
+
+    @property
+    def empty(self) -> bool:
+        return self.cells.empty
+
+    @staticmethod
+    def filled(series: pd.Series) -> pd.Series:
+        """Máscara de valores preenchidos (nem nulos nem texto vazio)"""
+        return series.notna() & (series != "")
+
+    @classmethod
+    def from_leads(cls, leads: pd.DataFrame) -> "DataCube":
+        """Agrega a tabela de leads do LeadDataset"""
+        if leads.empty or not set(CUBE_DIMENSIONS).issubset(leads.columns):
+            return cls(pd.DataFrame(columns=CUBE_DIMENSIONS + CUBE_MEASURES))
+
+        facts = leads[CUBE_DIMENSIONS].assign(
+            leads=1,
+            com_nome=cls.filled(leads["nome"]).astype(int),
+            com_telefone=cls.filled(leads["telefone"]).astype(int),
+            com_status=cls.filled(leads["status"]).astype(int)
+        )
+
+        # dropna=False mantém os leads sem created_time (só saem no filtro de período)
+        cells = facts.groupby(CUBE_DIMENSIONS, observed=True, dropna=False)[
+            CUBE_MEASURES].sum().reset_index()
+
+        return cls(cells)
+
+    def slice(self, vendedor: str = None, date_range: tuple = None) -> "DataCube":
+        """Células do vendedor/período selecionados (mesma semântica do apply_filters)"""
+        cells = self.cells
+
+        if vendedor and vendedor != "Todos":
+            cells = cells[cells["vendedor"] == vendedor]
+
+        if date_range and len(date_range) == 2:
+            start_date, end_date = date_range
+            cells = cells[
+                (cells["created_date"] >= pd.Timestamp(start_date)) &
+                (cells["created_date"] <= pd.Timestamp(end_date))
+            ]
+
+        return DataCube(cells)
+
+    def totals(self) -> Dict[str, int]:
+        """Soma de cada medida no recorte"""
+        return {measure: int(self.cells[measure].sum()) for measure in CUBE_MEASURES}
+
+    def status_counts(self) -> pd.Series:
+        """Leads por status, do maior para o menor (sem status zerados)"""
+        counts = self.cells.groupby("status", observed=True)["leads"].sum()
+        return counts[counts > 0].sort_values(ascending=False, kind="stable")
+
+    def status_summary(self) -> pd.DataFrame:
+        """Leads por status com a categoria, a cor e a posição no funil
+
+        Mesma ordem de status_counts. order é -1 para status fora do funil.
+        """
+        summary = self.cells.groupby("status", observed=True).agg(
+            leads=("leads", "sum"), status_category=("status_category", "first"))
+        summary = summary[summary["leads"] > 0].sort_values(
+            "leads", ascending=False, kind="stable")
+
+        summary["color"] = summary["status_category"].map(
+            settings.STATUS_CATEGORY_COLORS)
+        summary["order"] = [
+            settings.STATUS_LOOKUP.get(status, settings.STATUS_UNKNOWN).order
+            for status in summary.index
+        ]
+        return summary
+
+    def seller_stats(self) -> pd.DataFrame:
+        """Totais por vendedor numa única passada: total_leads, vendas,
+        perdidos, em_progresso e conversion_rate (%)
+
+        Cada célula vira contagens por categoria de status (máscara booleana ×
+        leads) e um groupby simples soma tudo. Alimenta os dois gráficos por
+        vendedor e os cards de KPI.
+        """
+        cells = self.cells
+        category = cells["status_category"]
+        stats = pd.DataFrame({
+            "vendedor": cells["vendedor"],
+            "total_leads": cells["leads"],
+            "vendas": cells["leads"].where(category == settings.STATUS_CATEGORY_CONVERSION, 0),
+            "perdidos": cells["leads"].where(category == settings.STATUS_CATEGORY_LOST, 0),
+            "em_progresso": cells["leads"].where(category == settings.STATUS_CATEGORY_IN_PROGRESS, 0)
+        }).groupby("vendedor", observed=True).sum()
+
+        stats["conversion_rate"] = (
+            stats["vendas"] / stats["total_leads"] * 100).round(2)
+        return stats
+
+    def daily_counts(self) -> pd.Series:
+        """Leads criados por dia"""
+        return self.cells.groupby("created_date")["leads"].sum()
@@ -1,111 +1,646 @@
+import time
 import pandas as pd
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from itertools import islice
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from urllib.parse import unquote
+from config.settings import settings
+from services.data_cube import DataCube
+from services.lead_buffer import LeadColumnBuffer, LEAD_COLUMNS, LEAD_FIELDS
 from services.notion_client import NotionClient
+from services.property_plan import PropertyPlan, match_lead_field, schema_hash
+from services.seller_resolver import SellerNameResolver
+from services.snapshot_store import SnapshotStore, RawEntriesWriter
 
 
 class DataProcessor:
     def __init__(self):
         self.notion_client = NotionClient()
+        self.seller_resolver = SellerNameResolver(self.notion_client)
+        # ✅ Estado da sincronização incremental, por database_id:
+        # vendedor, database, frame (leads válidos), o last_edited_time mais
+        # recente das entradas, o last_edited_time/schema_hash do database e
+        # o resultado do filtro de qualidade (low_quality)
+        self.database_cache: Dict[str, Dict[str, Any]] = {}
+        # Databases reaproveitados sem consulta na última carga incremental
+        self.unchanged_databases: List[str] = []
+        # IDs da última busca por databases, na ordem da busca, e se ela foi
+        # até o fim (só então databases ausentes são tratados como removidos)
+        self.database_order: List[str] = []
+        self.search_complete = False
+        # Horário da última carga completa (FULL_SYNC_HOURS)
+        self.last_full_sync_at: Optional[float] = None
+        # ✅ Snapshot em disco: o estado incremental é reconstruído sob demanda
+        self.snapshot_store = SnapshotStore() if settings.SNAPSHOT_ENABLED else None
+        self.snapshot_checked = False
+        self.snapshot_saved_at: Optional[float] = None
+        self.pending_snapshot_databases: Dict[str, Dict[str, Any]] = None
+
+    def get_all_sales_data(self, max_workers: int = None, incremental: bool = False) -> pd.DataFrame:
+        """Coleta dados de vendas de todos os databases
+
+        Com incremental=True, databases já sincronizados buscam apenas as
+        entradas editadas desde a última carga e as mesclam pelo lead_id.
+        Entradas arquivadas no Notion não aparecem nessa consulta, então a
+        cada FULL_SYNC_HOURS a carga vira completa e as remove. Databases que
+        saíram da busca deixam o estado incremental em qualquer modo.
+        """
+        # O resumo final mostra os contadores desta carga, não do processo
+        self.notion_client.reset_stats()
+
+        full_sync = not incremental or self.full_sync_due()
+        if incremental:
+            self.restore_database_cache()
+            if full_sync:
+                print("🔁 Carga completa periódica (FULL_SYNC_HOURS)")
+        else:
+            self.database_cache = {}
+            self.pending_snapshot_databases = None
+        self.unchanged_databases = []
+
+        results = self.map_databases(
+            lambda database: self.process_database(database, full=full_sync), max_workers)
+        df = self.concat_frames(results)
+
+        self.prune_database_cache()
+        if full_sync and self.search_complete:
+            self.last_full_sync_at = time.time()
 
-    def get_all_sales_data(self) -> pd.DataFrame:
-        """Coleta dados de vendas de todos os databases"""
-        all_data = []
+        print(f"RESUMO FINAL:")
+        print(f"Total de leads coletados: {len(df)}")
+        if self.unchanged_databases:
+            print(
+                f"Databases sem alterações (sem consulta): {len(self.unchanged_databases)}")
+        print(
+            f"Requisições ao Notion: {self.notion_client.get_request_stats()}")
+        unhandled = self.notion_client.get_unhandled_property_types()
+        if unhandled:
+            print(f"DEBUG: Tipos de propriedade não tratados: {unhandled}")
 
-        # Buscar todos os databases
-        databases = self.notion_client.get_all_databases()
+        # Para depuração: mostre os valores únicos de status após o processamento inicial
+        if not df.empty:
+            print(
+                f"DEBUG: Valores únicos de status após extração: {df['status'].unique()}")
+            print(f"DEBUG: Vendedores únicos: {df['vendedor'].unique()}")
+
+        self.save_snapshot(df)
+        return df
+
+    @staticmethod
+    def concat_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+        """Junta os leads de cada database em uma única tabela"""
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=LEAD_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def map_databases(self, process: Callable[[Dict[str, Any]], pd.DataFrame],
+                      max_workers: int = None) -> List[pd.DataFrame]:
+        """Aplica process a cada database acessível, na ordem da busca
+
+        Os IDs encontrados ficam em database_order. Se a busca falhar no
+        meio, os databases já encontrados são processados e search_complete
+        fica False.
+        """
+        if max_workers is None:
+            max_workers = settings.NOTION_MAX_WORKERS
+
+        # Nomes de vendedores cujas páginas foram editadas serão buscados de novo
+        self.seller_resolver.check_changes()
+
+        database_ids = []
+        self.search_complete = False
+
+        # Buscar todos os databases, em streaming: cada página da busca já é
+        # processada enquanto as próximas ainda estão sendo carregadas
+        def iter_databases():
+            try:
+                for database in self.notion_client.iter_databases(raise_errors=True):
+                    database_ids.append(database["id"])
+                    yield database
+            except Exception as e:
+                print(f"Erro ao buscar databases: {e}")
+                return
+            self.search_complete = True
+
+        databases = iter_databases()
+
+        # ✅ MODO CONCORRENTE: pool limitado de workers; o rate limiter do
+        # NotionClient é compartilhado, então o limite de ~3 req/s é respeitado.
+        # Os resultados são lidos na ordem de submissão, mantendo o mesmo
+        # resultado do modo sequencial.
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(process, database)
+                           for database in databases]
+                results = [future.result() for future in futures]
+        else:
+            results = [process(database) for database in databases]
+
+        print(f"Encontrados {len(results)} databases")
+        if not self.search_complete:
+            # Busca incompleta: os databases não encontrados mantêm a posição anterior
+            found = set(database_ids)
+            database_ids += [database_id for database_id in self.database_order
+                             if database_id not in found]
+        self.database_order = database_ids
+
+        self.seller_resolver.save()
+        return results
+
+    def full_sync_due(self) -> bool:
+        """A próxima carga incremental deve ser completa? (FULL_SYNC_HOURS)"""
+        if settings.FULL_SYNC_HOURS <= 0:
+            return False
+        if self.last_full_sync_at is None:
+            return True
+        return (time.time() - self.last_full_sync_at) / 3600 >= settings.FULL_SYNC_HOURS
 
-        print(f"Encontrados {len(databases)} databases")
+    def prune_database_cache(self) -> None:
+        """Remove do estado incremental os databases que saíram da busca
 
-        for database in databases:
-            database_id = database["id"]
-
-            # Pegar título do database
-            db_title_prop = database.get("title", [])
-            db_title = db_title_prop[0].get(
-                "plain_text", "Sem título") if db_title_prop else "Sem título"
-
-            # Pegar informações do parent (página pai)
-            parent_info = database.get("parent", {})
-            parent_type = parent_info.get("type", "")
-
-            # Se for um database de página, tentar pegar o nome da página
-            vendedor_name = db_title
-            if parent_type == "page_id":
-                page_id = parent_info.get("page_id")
-                try:
-                    page_info = self.notion_client.client.pages.retrieve(
-                        page_id=page_id)
-                    page_title_prop = page_info.get(
-                        "properties", {}).get("title", {})
-                    if page_title_prop:
-                        page_title = self.notion_client.extract_property_value(
-                            page_title_prop)
-                        if page_title:
-                            vendedor_name = page_title
-                except Exception as e:
-                    print(
-                        f"Erro ao buscar info da página {page_id} para vendedor: {e}")
-                    pass
-
-            # ✅ FILTRO 1: Excluir páginas específicas duplicadas
-            if self.is_duplicate_page(vendedor_name):
-                print(f"🚫 PÁGINA DUPLICADA IGNORADA: '{vendedor_name}'")
-                continue
+        O database_cache fica na ordem da busca; o manifest e as entradas
+        brutas do snapshot acompanham. Só roda depois de uma busca completa.
+        """
+        if not self.search_complete:
+            return
 
+        removed = set(self.database_cache) - set(self.database_order)
+        for database_id in removed:
+            self.drop_cached_database(database_id)
+        if removed:
             print(
-                f"Processando database: '{db_title}' - Vendedor: '{vendedor_name}'")
+                f"🗑️ Databases removidos do estado incremental: {len(removed)}")
+
+        self.database_cache = {
+            database_id: self.database_cache[database_id]
+            for database_id in self.database_order if database_id in self.database_cache
+        }
 
-            # Buscar TODAS as entradas do database (sem limitação)
-            entries = self.notion_client.get_database_entries(database_id)
+    def drop_cached_database(self, database_id: str) -> None:
+        """Tira um database do estado incremental e apaga suas entradas brutas"""
+        if self.database_cache.pop(database_id, None) is None or not self.snapshot_store:
+            return
 
+        try:
+            self.snapshot_store.remove_raw_entries(database_id)
+        except OSError as e:
             print(
-                f"Processando {len(entries)} entradas para database '{db_title}'")
+                f"Erro ao apagar entradas brutas do database {database_id}: {e}")
+
+    def refresh_databases(self, database_id: str = None, vendedor: str = None) -> pd.DataFrame:
+        """Recarrega só um database (pelo id) ou os databases de um vendedor
+
+        Busca todas as entradas desses databases, refaz a extração e o filtro
+        de qualidade deles e devolve a tabela completa, com os leads e o
+        resultado do filtro de qualidade dos demais databases reaproveitados
+        do database_cache sem nenhuma requisição. Levanta ValueError se nada
+        corresponder ou se algum database não puder ser lido (nesse caso nada
+        é alterado).
+        """
+        self.restore_database_cache()
+        self.seller_resolver.check_changes()
+
+        if database_id:
+            database_ids = [database_id]
+        else:
+            database_ids = [
+                cached_id for cached_id, cached in self.database_cache.items()
+                if cached["vendedor"] == vendedor
+            ]
+        if not database_ids:
+            raise ValueError(f"Nenhum database encontrado para '{vendedor}'")
+
+        databases = {
+            refresh_id: self.notion_client.get_database_info(refresh_id)
+            for refresh_id in database_ids
+        }
+        failed = [refresh_id for refresh_id, database in databases.items() if not database]
+        if failed:
+            raise ValueError(
+                f"Não foi possível ler {len(failed)} database(s) de '{vendedor or database_id}' no Notion: {', '.join(failed)}")
+
+        for refresh_id, database in databases.items():
+            self.process_database(database, full=True)
+            if refresh_id not in self.database_order:
+                self.database_order.append(refresh_id)
+
+        self.seller_resolver.save()
+        df = self.cached_sales_data()
+        print(
+            f"Atualização parcial ({vendedor or database_id}): {len(database_ids)} database(s), {len(df)} leads no total")
+
+        self.save_snapshot(df)
+        return df
+
+    def cached_sales_data(self) -> pd.DataFrame:
+        """Tabela completa montada a partir do database_cache
+
+        Segue a ordem da última busca (a mesma de get_all_sales_data) e usa o
+        resultado do filtro de qualidade guardado para cada database.
+        """
+        frames = []
+        for database_id in self.database_order:
+            cached = self.database_cache.get(database_id)
+            if cached and not cached["low_quality"]:
+                frames.append(cached["frame"])
+        return self.concat_frames(frames)
+
+    def get_filtered_sales_data(self, vendedor: str = None, date_range: Tuple[date, date] = None,
+                                max_workers: int = None) -> pd.DataFrame:
+        """Coleta apenas os leads de um vendedor e/ou período (modo pushdown)
+
+        Databases de outros vendedores não são consultados e o período vira um
+        filtro de created_time na própria query do Notion. Não altera o estado
+        incremental nem o snapshot, que representam o workspace inteiro.
+        """
+        if vendedor == "Todos":
+            vendedor = None
+
+        query_filter = None
+        if date_range:
+            query_filter = self.notion_client.created_between_filter(
+                *date_range)
+
+        results = self.map_databases(
+            lambda database: self.process_database_filtered(
+                database, query_filter, vendedor),
+            max_workers)
+
+        df = self.concat_frames(results)
+        print(
+            f"Total de leads coletados (pushdown: vendedor={vendedor}, período={date_range}): {len(df)}")
 
-            # Contadores para estatísticas
-            leads_processados = 0
-            leads_validos = 0
+        return df
 
-            # Lista temporária para validar qualidade dos dados
-            temp_leads = []
+    def list_sellers(self) -> List[str]:
+        """Lista os vendedores (sem buscar entradas), para montar os filtros"""
+        self.seller_resolver.check_changes()
+        databases = list(self.notion_client.iter_databases())
+        page_ids = [database.get("parent", {}).get("page_id") for database in databases
+                    if database.get("parent", {}).get("type") == "page_id"]
+        self.seller_resolver.resolve_many(page_ids)
 
-            for entry in entries:
-                leads_processados += 1
-                lead_data = self.extract_lead_data(
-                    entry, vendedor_name, db_title)
+        sellers = set()
+        for database in databases:
+            vendedor_name = self.get_seller_name(
+                database, self.get_database_title(database))
+            if not self.is_duplicate_page(vendedor_name):
+                sellers.add(vendedor_name)
+
+        return sorted(sellers)
+
+    def get_sync_state(self) -> Dict[str, Dict[str, Any]]:
+        """Estado da sincronização por database (sem os leads)"""
+        return {
+            database_id: {
+                "vendedor": cached["vendedor"],
+                "database": cached["database"],
+                "last_edited_time": cached["last_edited_time"],
+                "database_edited_time": cached.get("database_edited_time"),
+                "schema_hash": cached.get("schema_hash"),
+                "low_quality": cached["low_quality"]
+            }
+            for database_id, cached in self.database_cache.items()
+        }
 
-                if lead_data:
-                    temp_leads.append(lead_data)
+    def save_snapshot(self, df: pd.DataFrame) -> None:
+        """Grava a tabela processada e o estado da sincronização em disco"""
+        if not self.snapshot_store:
+            return
+
+        try:
+            version = self.snapshot_store.save(
+                df, self.get_sync_state(), full_sync_at=self.last_full_sync_at)
+            print(f"💾 Snapshot v{version} gravado com {len(df)} leads")
+        except Exception as e:
+            print(f"Erro ao gravar snapshot: {e}")
+
+    def load_snapshot(self) -> pd.DataFrame:
+        """Carrega o último snapshot em disco; retorna None se ausente ou expirado
+
+        Os leads por database não são reconstruídos aqui, para servir o
+        snapshot imediatamente: isso acontece na próxima sincronização
+        incremental (restore_database_cache).
+        """
+        self.snapshot_checked = True
+        if not self.snapshot_store:
+            return None
+
+        manifest = self.snapshot_store.load_manifest()
+        if not manifest:
+            return None
+
+        self.pending_snapshot_databases = manifest.get("databases", {})
+        self.last_full_sync_at = manifest.get("full_sync_at")
+
+        age_hours = self.snapshot_store.age_hours(manifest)
+        if not self.snapshot_store.is_fresh(manifest):
+            print(f"⚠️ Snapshot v{manifest['version']} expirado ({age_hours:.1f}h)")
+            return None
+
+        try:
+            df = self.snapshot_store.load()
+        except Exception as e:
+            print(f"Erro ao ler snapshot: {e}")
+            return None
+
+        if df is not None:
+            self.snapshot_saved_at = manifest.get("saved_at")
+            print(
+                f"📦 Snapshot v{manifest['version']} carregado ({age_hours:.1f}h) com {len(df)} leads")
+        return df
+
+    def restore_database_cache(self) -> None:
+        """Reconstrói o estado incremental a partir das entradas brutas do snapshot"""
+        if not self.pending_snapshot_databases or self.database_cache:
+            self.pending_snapshot_databases = None
+            return
+
+        for database_id, info in self.pending_snapshot_databases.items():
+            buffer = LeadColumnBuffer()
+            plan = None
+            entries = self.snapshot_store.iter_raw_entries(database_id)
+            # Extrair em lotes do mesmo tamanho das páginas do Notion
+            for page_results in iter(lambda: list(islice(entries, 100)), []):
+                if plan is None:
+                    plan = self.compile_property_plan(page_results[0])
+
+                buffer.extend(self.extract_lead_columns(
+                    page_results, info["vendedor"], info["database"], plan))
+
+            frame = buffer.to_frame()
+            low_quality = info.get("low_quality")
+            if low_quality is None:
+                low_quality = self.is_low_quality_database(
+                    frame, info["vendedor"])
+
+            self.database_cache[database_id] = {
+                "vendedor": info["vendedor"],
+                "database": info["database"],
+                "frame": frame,
+                "last_edited_time": info["last_edited_time"],
+                "database_edited_time": info.get("database_edited_time"),
+                "schema_hash": info.get("schema_hash"),
+                "low_quality": low_quality
+            }
+
+        # O manifest é gravado na ordem da busca (prune_database_cache)
+        if not self.database_order:
+            self.database_order = list(self.database_cache)
+
+        print(
+            f"📦 Estado incremental restaurado do snapshot: {len(self.database_cache)} databases")
+        self.pending_snapshot_databases = None
+
+    def resolve_projection(self, database: Dict[str, Any]) -> Optional[List[str]]:
+        """IDs das propriedades usadas pelo dashboard, para filter_properties
+
+        Usa o schema que já vem na busca (ou get_database_info). Retorna None
+        (buscar todas as propriedades) quando INCLUDE_RAW_PROPERTIES está ativo
+        ou quando nenhuma propriedade conhecida foi encontrada. Os IDs do
+        schema vêm codificados para URL e o httpx codifica de novo ao montar a
+        query string, então são decodificados aqui.
+        """
+        if settings.INCLUDE_RAW_PROPERTIES:
+            return None
+
+        schema = database.get("properties")
+        if not schema:
+            schema = self.notion_client.get_database_info(
+                database["id"]).get("properties", {})
+
+        property_ids = [
+            unquote(prop["id"]) for prop_name, prop in schema.items()
+            if prop.get("id") and (match_lead_field(prop_name) or prop.get("type") == "status")
+        ]
+        return property_ids or None
+
+    def get_database_title(self, database: Dict[str, Any]) -> str:
+        """Pega o título do database"""
+        db_title_prop = database.get("title", [])
+        return db_title_prop[0].get(
+            "plain_text", "Sem título") if db_title_prop else "Sem título"
+
+    def get_seller_name(self, database: Dict[str, Any], db_title: str) -> str:
+        """Resolve o nome do vendedor a partir da página pai do database"""
+        # Pegar informações do parent (página pai)
+        parent_info = database.get("parent", {})
+        parent_type = parent_info.get("type", "")
+
+        # Se for um database de página, usar o título da página (com cache)
+        vendedor_name = db_title
+        if parent_type == "page_id":
+            page_title = self.seller_resolver.resolve(
+                parent_info.get("page_id"))
+            if page_title:
+                vendedor_name = page_title
+
+        return vendedor_name
+
+    def process_database(self, database: Dict[str, Any], full: bool = False) -> pd.DataFrame:
+        """Busca, extrai e valida os leads de um único database
+
+        Cada página de resultados do Notion é extraída assim que chega para um
+        buffer colunar e descartada em seguida, então o pico de memória
+        depende do tamanho da página, não do tamanho do database. Com
+        full=True ignora o estado incremental e busca todas as entradas.
+        """
+        database_id = database["id"]
+        db_title = self.get_database_title(database)
+
+        vendedor_name = self.get_seller_name(database, db_title)
+
+        # ✅ FILTRO 1: Excluir páginas específicas duplicadas
+        if self.is_duplicate_page(vendedor_name):
+            print(f"🚫 PÁGINA DUPLICADA IGNORADA: '{vendedor_name}'")
+            self.drop_cached_database(database_id)
+            return pd.DataFrame(columns=LEAD_COLUMNS)
 
-            # ✅ FILTRO 2: Verificar qualidade dos dados do database
-            if self.is_low_quality_database(temp_leads, vendedor_name):
+        print(
+            f"Processando database: '{db_title}' - Vendedor: '{vendedor_name}'")
+
+        cached = self.database_cache.get(database_id)
+        database_edited_time = database.get("last_edited_time")
+        database_schema = schema_hash(database.get("properties", {}))
+
+        # ✅ DATABASE SEM ALTERAÇÕES: o last_edited_time do database (que vem
+        # na busca) e o schema são os mesmos da última sincronização, então os
+        # leads já extraídos são reaproveitados sem nenhuma consulta
+        if (cached and not full and database_edited_time
+                and cached.get("database_edited_time") == database_edited_time
+                and cached.get("schema_hash") == database_schema):
+            self.unchanged_databases.append(database_id)
+            frame = cached["frame"]
+            if cached["vendedor"] != vendedor_name:
+                # O filtro de qualidade também depende do nome do vendedor
+                cached["low_quality"] = self.is_low_quality_database(
+                    frame, vendedor_name)
+            frame["vendedor"] = vendedor_name
+            frame["database"] = db_title
+            cached.update(vendedor=vendedor_name, database=db_title)
+
+            if cached["low_quality"]:
                 print(
-                    f"🚫 DATABASE COM BAIXA QUALIDADE IGNORADO: '{vendedor_name}' - {len(temp_leads)} leads")
-                continue
+                    f"🚫 DATABASE COM BAIXA QUALIDADE IGNORADO: '{vendedor_name}' - {len(frame)} leads")
+                return pd.DataFrame(columns=LEAD_COLUMNS)
+            print(f"Database sem alterações: '{db_title}' ({len(frame)} leads)")
+            return frame
+
+        # Schema alterado (ex.: propriedade renomeada): o PropertyPlan pode ter
+        # mudado sem que o last_edited_time das entradas mude, então todas são
+        # extraídas de novo em vez de mesclar colunas de planos diferentes
+        if cached and cached.get("schema_hash") != database_schema:
+            full = True
+
+        since = cached["last_edited_time"] if cached and not full else None
+        filter_properties = self.resolve_projection(database)
+
+        # ✅ SINCRONIZAÇÃO INCREMENTAL: só entradas editadas desde a última carga
+        query_filter = self.notion_client.edited_since_filter(
+            since) if since else None
+
+        # O Notion arredonda o last_edited_time do database para o minuto: se
+        # ele cair no minuto da consulta, edições logo depois dela teriam o
+        # mesmo valor, então não é usado para pular o database na próxima carga
+        query_minute = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M")
+        if database_edited_time and database_edited_time[:16] >= query_minute:
+            database_edited_time = None
+
+        # Contadores para estatísticas
+        leads_processados = 0
+        newest_edit = since or ""
+        seen_ids = []
+        buffer = LeadColumnBuffer()
+        plan = None
+
+        try:
+            with RawEntriesWriter(self.snapshot_store, database_id, merge=bool(since)) as raw_writer:
+                for page_results in self.notion_client.iter_database_pages(
+                        database_id, query_filter, filter_properties):
+                    raw_writer.write(page_results)
+                    if not page_results:
+                        continue
+
+                    leads_processados += len(page_results)
+                    newest_edit = max([newest_edit] + [
+                        entry.get("last_edited_time", "") for entry in page_results])
+                    seen_ids.extend(entry.get("id", "")
+                                    for entry in page_results)
+
+                    # ✅ Mapeamento compilado uma vez, na primeira entrada
+                    if plan is None:
+                        plan = self.compile_property_plan(page_results[0])
+
+                    buffer.extend(self.extract_lead_columns(
+                        page_results, vendedor_name, db_title, plan))
+
+                    # Liberar o payload bruto antes de buscar a próxima página
+                    del page_results
+        except Exception as e:
+            # Só chega aqui após esgotar as retentativas (ou erro não temporário)
+            print(f"Erro ao buscar entradas do database {database_id}: {e}")
+            if not cached:
+                return pd.DataFrame(columns=LEAD_COLUMNS)
+            # Manter os dados anteriores (e o estado anterior do database, para
+            # tentar de novo na próxima), inclusive numa carga completa
+            since = since or cached["last_edited_time"]
+            seen_ids = []
+            buffer = LeadColumnBuffer()
+            newest_edit = since
+            database_edited_time = cached.get("database_edited_time")
+            database_schema = cached.get("schema_hash")
+
+        if since:
+            print(
+                f"Sincronização incremental: {leads_processados} entradas alteradas desde {since} em '{db_title}'")
+            # Mesclar pelo lead_id: entradas alteradas substituem as anteriores e
+            # leads que deixaram de ter nome/telefone saem do dataset
+            previous = cached["frame"]
+            frame = self.concat_frames([
+                previous[~previous["lead_id"].isin(seen_ids)],
+                buffer.to_frame()
+            ])
+            # Manter vendedor/database atualizados nos leads que não mudaram
+            frame["vendedor"] = vendedor_name
+            frame["database"] = db_title
+        else:
+            frame = buffer.to_frame()
+            print(
+                f"Processadas {leads_processados} entradas para database '{db_title}'")
+
+        # ✅ FILTRO 2: Verificar qualidade dos dados do database
+        low_quality = self.is_low_quality_database(frame, vendedor_name)
+
+        self.database_cache[database_id] = {
+            "vendedor": vendedor_name,
+            "database": db_title,
+            "frame": frame,
+            "last_edited_time": newest_edit or None,
+            "database_edited_time": database_edited_time,
+            "schema_hash": database_schema,
+            "low_quality": low_quality
+        }
 
-            # Se passou nos filtros, adicionar os leads válidos
-            for lead in temp_leads:
-                leads_validos += 1
-                all_data.append(lead)
+        if low_quality:
+            print(
+                f"🚫 DATABASE COM BAIXA QUALIDADE IGNORADO: '{vendedor_name}' - {len(frame)} leads")
+            return pd.DataFrame(columns=LEAD_COLUMNS)
 
-            leads_sem_nome_telefone = leads_processados - leads_validos
+        # Se passou nos filtros, retornar os leads válidos
+        leads_validos = len(frame)
 
-            print(f"✅ Estatísticas do database '{db_title}':")
-            print(f"  - Total processados: {leads_processados}")
-            print(f"  - Leads válidos (com nome/telefone): {leads_validos}")
+        print(f"✅ Estatísticas do database '{db_title}':")
+        print(f"  - Total processados: {leads_processados}")
+        print(f"  - Leads válidos (com nome/telefone): {leads_validos}")
+        if not since:
+            leads_sem_nome_telefone = leads_processados - leads_validos
             print(
                 f"  - Leads ignorados (sem nome/telefone): {leads_sem_nome_telefone}")
 
-        print(f"RESUMO FINAL:")
-        print(f"Total de leads coletados: {len(all_data)}")
+        return frame
 
-        # Para depuração: mostre os valores únicos de status após o processamento inicial
-        if all_data:
-            temp_df = pd.DataFrame(all_data)
+    def process_database_filtered(self, database: Dict[str, Any], query_filter: Dict[str, Any] = None,
+                                  vendedor: str = None) -> pd.DataFrame:
+        """Busca e valida só as entradas que passam no filtro (modo pushdown)"""
+        db_title = self.get_database_title(database)
+        vendedor_name = self.get_seller_name(database, db_title)
+
+        # Databases de outros vendedores nem chegam a ser consultados
+        if vendedor and vendedor_name != vendedor:
+            return pd.DataFrame(columns=LEAD_COLUMNS)
+
+        if self.is_duplicate_page(vendedor_name):
+            print(f"🚫 PÁGINA DUPLICADA IGNORADA: '{vendedor_name}'")
+            return pd.DataFrame(columns=LEAD_COLUMNS)
+
+        buffer = LeadColumnBuffer()
+        plan = None
+        try:
+            for page_results in self.notion_client.iter_database_pages(
+                    database["id"], query_filter, self.resolve_projection(database)):
+                if not page_results:
+                    continue
+
+                if plan is None:
+                    plan = self.compile_property_plan(page_results[0])
+
+                buffer.extend(self.extract_lead_columns(
+                    page_results, vendedor_name, db_title, plan))
+        except Exception as e:
+            print(f"Erro ao buscar entradas do database {database['id']}: {e}")
+            return pd.DataFrame(columns=LEAD_COLUMNS)
+
+        frame = buffer.to_frame()
+
+        # A qualidade é avaliada sobre o subconjunto filtrado
+        if self.is_low_quality_database(frame, vendedor_name):
             print(
-                f"DEBUG: Valores únicos de status após extração: {temp_df['status'].unique()}")
-            print(f"DEBUG: Vendedores únicos: {temp_df['vendedor'].unique()}")
+                f"🚫 DATABASE COM BAIXA QUALIDADE IGNORADO: '{vendedor_name}' - {len(frame)} leads")
+            return pd.DataFrame(columns=LEAD_COLUMNS)
 
-        return pd.DataFrame(all_data)
+        return frame
 
     def is_duplicate_page(self, vendedor_name: str) -> bool:
         """Verifica se é uma página duplicada que deve ser ignorada"""
@@ -138,22 +673,22 @@ class DataProcessor:
             return value
         return str(value)
 
-    def is_low_quality_database(self, leads: List[Dict], vendedor_name: str) -> bool:
+    def is_low_quality_database(self, leads: pd.DataFrame, vendedor_name: str) -> bool:
         """Verifica se o database tem baixa qualidade de dados"""
 
-        if not leads:
+        if leads.empty:
             return True  # Database vazio
 
         total_leads = len(leads)
 
-        # ✅ CORREÇÃO: Usar função segura para verificar strings
-        leads_com_nome = sum(1 for lead in leads if self.safe_get_string(
-            lead.get("nome", "")).strip())
-        leads_com_telefone = sum(1 for lead in leads if self.safe_get_string(
-            lead.get("telefone", "")).strip())
-        leads_com_nome_ou_telefone = sum(1 for lead in leads if
-                                         self.safe_get_string(lead.get("nome", "")).strip() or
-                                         self.safe_get_string(lead.get("telefone", "")).strip())
+        # ✅ CORREÇÃO: Tratar valores nulos antes de verificar strings
+        tem_nome = leads["nome"].fillna("").astype(str).str.strip() != ""
+        tem_telefone = leads["telefone"].fillna(
+            "").astype(str).str.strip() != ""
+
+        leads_com_nome = int(tem_nome.sum())
+        leads_com_telefone = int(tem_telefone.sum())
+        leads_com_nome_ou_telefone = int((tem_nome | tem_telefone).sum())
 
         # Calcular percentuais de qualidade
         percentual_nome = (leads_com_nome / total_leads) * \
@@ -193,70 +728,55 @@ class DataProcessor:
         print(f"✅ APROVADO: Database passou nos critérios de qualidade")
         return False
 
-    def extract_lead_data(self, entry: Dict[str, Any], vendedor: str, database_name: str) -> Dict[str, Any]:
-        """Extrai dados de um lead individual"""
-        properties = entry.get("properties", {})
-
-        lead_data = {
-            "vendedor": vendedor,
-            "database": database_name,
-            "lead_id": entry.get("id", ""),
-            "created_time": entry.get("created_time", ""),
-            "last_edited_time": entry.get("last_edited_time", ""),
-            "data": "",
-            "nome": "",
-            "telefone": "",
-            "curso": "",
-            "status": ""
+    def compile_property_plan(self, entry: Dict[str, Any]) -> PropertyPlan:
+        """Compila o mapeamento de colunas a partir das propriedades de uma entrada"""
+        return PropertyPlan.compile(
+            entry.get("properties", {}), settings.INCLUDE_RAW_PROPERTIES)
+
+    def extract_lead_columns(self, entries: List[Dict[str, Any]], vendedor: str, database_name: str,
+                             plan: PropertyPlan) -> Dict[str, List[Any]]:
+        """Extrai uma página de entradas para colunas de leads válidos"""
+        columns = self.notion_client.extract_columns(entries, plan)
+        size = len(columns["lead_id"])
+
+        lead_columns = {
+            "vendedor": [vendedor] * size,
+            "database": [database_name] * size,
+            "lead_id": columns["lead_id"],
+            "created_time": columns["created_time"],
+            "last_edited_time": columns["last_edited_time"]
         }
 
-        # Mapear propriedades
-        for prop_name, prop_data in properties.items():
-            value = self.notion_client.extract_property_value(prop_data)
-            prop_name_lower = prop_name.lower()
-
-            # ✅ CORREÇÃO: Converter valor para string segura
-            safe_value = self.safe_get_string(value)
-
-            # Mapear baseado no nome da propriedade
-            if any(keyword in prop_name_lower for keyword in ["data", "date"]):
-                lead_data["data"] = safe_value
-            elif any(keyword in prop_name_lower for keyword in ["nome", "name", "cliente"]):
-                lead_data["nome"] = safe_value
-            elif any(keyword in prop_name_lower for keyword in ["telefone", "phone", "tel", "fone"]):
-                lead_data["telefone"] = safe_value
-            elif any(keyword in prop_name_lower for keyword in ["curso", "course", "produto"]):
-                lead_data["curso"] = safe_value
-            elif any(keyword in prop_name_lower for keyword in ["status", "etapa", "stage"]):
-                lead_data["status"] = safe_value
-
-            # Adicionar propriedade original também
-            lead_data[f"prop_{prop_name.lower()}"] = safe_value
-
-        # Se não encontrou status pelos nomes, tentar encontrar por tipo
-        if not lead_data["status"]:
-            for prop_name, prop_data in properties.items():
-                if prop_data.get("type") == "status":
-                    value = self.notion_client.extract_property_value(
-                        prop_data)
-                    if value:
-                        lead_data["status"] = self.safe_get_string(value)
-                        break
-
-        # ✅ VALIDAÇÃO CORRIGIDA: Só retornar se tiver Nome E/OU Telefone preenchidos
-        nome_preenchido = lead_data["nome"] and lead_data["nome"].strip() != ""
-        telefone_preenchido = lead_data["telefone"] and lead_data["telefone"].strip(
-        ) != ""
-
-        if nome_preenchido or telefone_preenchido:
-            return lead_data
-
-        # Lead ignorado por não ter nome nem telefone
-        return None
-
-    def calculate_conversion_metrics(self, df: pd.DataFrame) -> Dict[str, Any]:
-        """Calcula métricas de conversão baseadas nos status específicos"""
-        if df.empty:
+        # ✅ CORREÇÃO: Converter valores para string segura
+        for column in LEAD_FIELDS:
+            values = columns.get(column)
+            lead_columns[column] = [self.safe_get_string(
+                value) for value in values] if values is not None else [""] * size
+
+        # Adicionar propriedades originais também (opt-in)
+        for _, column in plan.raw_columns:
+            lead_columns[column] = [self.safe_get_string(
+                value) for value in columns[column]]
+
+        # ✅ VALIDAÇÃO CORRIGIDA: Só manter leads com Nome E/OU Telefone preenchidos
+        keep = [bool(nome.strip()) or bool(telefone.strip())
+                for nome, telefone in zip(lead_columns["nome"], lead_columns["telefone"])]
+
+        if not all(keep):
+            lead_columns = {
+                column: [value for value, kept in zip(values, keep) if kept]
+                for column, values in lead_columns.items()
+            }
+
+        return lead_columns
+
+    def calculate_conversion_metrics(self, cube: DataCube) -> Dict[str, Any]:
+        """Calcula métricas de conversão baseadas nos status específicos
+
+        Recebe o recorte do DataCube já filtrado e soma os totais de
+        DataCube.seller_stats, em vez de varrer os leads.
+        """
+        if cube.empty:
             return {
                 "total_leads": 0,
                 "leads_fechados": 0,
@@ -266,19 +786,15 @@ class DataProcessor:
                 "revenue_total": 0
             }
 
-        total_leads = len(df)
-
-        # Garante que a coluna status é string, para evitar erros com .str.contains
-        df["status"] = df["status"].astype(str)
-
-        # ✅ CORREÇÃO: Usar a mesma lógica dos settings
-        from config.settings import settings
+        # Mesmos totais por vendedor usados nos gráficos, somados
+        totals = cube.seller_stats().sum()
+        total_leads = int(totals["total_leads"])
 
-        # Status que indicam venda fechada - usar lista exata dos settings
-        leads_fechados = len(df[df["status"].isin(settings.CONVERSION_STATUS)])
+        # Status que indicam venda fechada (settings.CONVERSION_STATUS)
+        leads_fechados = int(totals["vendas"])
 
-        # Status que indicam leads perdidos - usar lista exata dos settings
-        leads_perdidos = len(df[df["status"].isin(settings.LOST_STATUS)])
+        # Status que indicam leads perdidos (settings.LOST_STATUS)
+        leads_perdidos = int(totals["perdidos"])
 
         conversion_rate = (leads_fechados / total_leads *
                         100) if total_leads > 0 else 0
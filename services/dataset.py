@@ -0,0 +1,119 @@
+import time
+import numpy as np
+import pandas as pd
+from config.settings import settings
+from services.data_cube import DataCube
+from services.filter_engine import FilterEngine
+
+# Colunas de baixa cardinalidade guardadas como category
+CATEGORY_COLUMNS = ["vendedor", "database", "curso"]
+
+# Timestamps do Notion (ISO 8601, UTC) convertidos para datetime64 uma única vez
+TIMESTAMP_COLUMNS = {
+    "created_time": "created_at",
+    "last_edited_time": "last_edited_at"
+}
+
+RAW_PROPERTY_PREFIX = "prop_"
+
+
+class LeadDataset:
+    """Tabela de leads compacta, no formato usado pelo dashboard
+
+    leads tem vendedor/database/curso como category, status como category
+    ordenada por settings.LEAD_STATUS (com status_category, int8, vinda de
+    settings.STATUS_LOOKUP) e as datas já convertidas na carga:
+    created_at/last_edited_at (datetime64 UTC), created_date (dia da criação,
+    datetime64 sem fuso) e data. min_date/max_date são os limites do filtro de
+    período. As colunas prop_* (INCLUDE_RAW_PROPERTIES) ficam em
+    extra_properties, com o mesmo índice, para não pesar nas agregações.
+    cube guarda as contagens pré-agregadas usadas pelos gráficos e métricas
+    e filter_engine os índices de vendedor/período da tabela detalhada.
+    """
+
+    def __init__(self, leads: pd.DataFrame, extra_properties: pd.DataFrame = None):
+        self.leads = leads
+        # Definida pelo DatasetStore ao publicar (0 = não publicado)
+        self.version = 0
+        # Momento em que os dados foram lidos do Notion (snapshot: hora da gravação)
+        self.synced_at = time.time()
+        self.extra_properties = extra_properties if extra_properties is not None else pd.DataFrame(
+            index=leads.index)
+
+        # Limites do seletor de período, calculados uma vez
+        self.min_date = None
+        self.max_date = None
+        if "created_date" in leads.columns and leads["created_date"].notna().any():
+            self.min_date = leads["created_date"].min().date()
+            self.max_date = leads["created_date"].max().date()
+
+        self.cube = DataCube.from_leads(leads)
+        self.filter_engine = FilterEngine(leads)
+
+    def filter(self, vendedor: str = None, date_range: tuple = None) -> pd.DataFrame:
+        """Leads do vendedor/período; sem filtros devolve a própria tabela (sem cópia)"""
+        positions = self.filter_engine.positions(vendedor, date_range)
+        if positions is None:
+            return self.leads
+        return self.leads.take(positions)
+
+    @property
+    def empty(self) -> bool:
+        return self.leads.empty
+
+    @staticmethod
+    def status_dtype(statuses) -> pd.CategoricalDtype:
+        """Categorias de status na ordem do funil, seguidas dos status desconhecidos"""
+        known = list(settings.LEAD_STATUS)
+        extra = sorted(set(statuses) - set(known))
+        return pd.CategoricalDtype(categories=known + extra, ordered=True)
+
+    @staticmethod
+    def status_categories(status: pd.Series) -> np.ndarray:
+        """Código da categoria de cada lead, consultando o lookup uma vez por status"""
+        codes = np.array([
+            settings.STATUS_LOOKUP.get(category, settings.STATUS_UNKNOWN).category
+            for category in status.cat.categories
+        ], dtype=np.int8)
+        return codes[status.cat.codes.to_numpy()]
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "LeadDataset":
+        """Monta o dataset a partir da tabela plana de get_all_sales_data"""
+        df = df.reset_index(drop=True)
+
+        raw_columns = [
+            column for column in df.columns if column.startswith(RAW_PROPERTY_PREFIX)]
+        extra_properties = df[raw_columns]
+        leads = df.drop(columns=raw_columns)
+
+        for column in CATEGORY_COLUMNS:
+            if column in leads.columns:
+                leads[column] = leads[column].fillna("").astype(str).astype("category")
+
+        if "status" in leads.columns:
+            status = leads["status"].fillna("").astype(str)
+            leads["status"] = status.astype(cls.status_dtype(status.unique()))
+            leads["status_category"] = cls.status_categories(leads["status"])
+
+        for column, parsed_column in TIMESTAMP_COLUMNS.items():
+            if column in leads.columns:
+                leads[column] = pd.to_datetime(
+                    leads[column], errors="coerce", utc=True, format="ISO8601")
+        leads = leads.rename(columns=TIMESTAMP_COLUMNS)
+
+        if "created_at" in leads.columns:
+            leads["created_date"] = leads["created_at"].dt.tz_localize(
+                None).dt.normalize()
+
+        # Propriedade de data do CRM (texto ISO); valores inválidos viram NaT
+        if "data" in leads.columns:
+            leads["data"] = pd.to_datetime(
+                leads["data"].replace("", None), errors="coerce", utc=True, format="ISO8601").dt.tz_localize(None)
+
+        return cls(leads, extra_properties)
+
+    def memory_usage(self) -> int:
+        """Memória ocupada pelo dataset, em bytes"""
+        return int(self.leads.memory_usage(deep=True).sum() +
+                   self.extra_properties.memory_usage(deep=True).sum())
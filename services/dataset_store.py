@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Callable, Hashable, Optional
+from services.dataset import LeadDataset
+from services.single_flight import SingleFlight
+
+# Chave da carga completa no SingleFlight
+FULL_REFRESH = "full"
+
+
+class DatasetStore:
+    """Dataset único do processo, compartilhado por todas as sessões
+
+    Cada versão publicada é imutável: ninguém altera leads/cube depois da
+    publicação, e os filtros de cada sessão só leem (FilterEngine, cube.slice).
+    Uma atualização monta um LeadDataset novo e troca a referência de uma vez,
+    então as sessões nunca guardam cópias próprias dos dados.
+
+    As cargas passam por um SingleFlight: pedidos simultâneos da mesma carga
+    recebem o resultado da que já está rodando, e cargas diferentes (que
+    usam o mesmo DataProcessor) rodam uma de cada vez.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+        # Serializa a execução das cargas (o DataProcessor não é thread-safe)
+        self.load_lock = threading.Lock()
+        self.dataset: Optional[LeadDataset] = None
+        self.version = 0
+        self.loaded_at: Optional[float] = None
+
+    def current(self) -> Optional[LeadDataset]:
+        """Versão publicada (None antes da primeira carga)"""
+        return self.dataset
+
+    def publish(self, dataset: LeadDataset) -> LeadDataset:
+        """Publica uma nova versão, trocando a referência atomicamente"""
+        with self.lock:
+            self.version += 1
+            dataset.version = self.version
+            self.loaded_at = time.time()
+            self.dataset = dataset
+        return dataset
+
+    def get(self, loader: Callable[[], LeadDataset]) -> LeadDataset:
+        """Versão atual; carrega com loader se ainda não houver nenhuma"""
+        dataset = self.dataset
+        if dataset is not None:
+            return dataset
+
+        def load_once() -> LeadDataset:
+            with self.load_lock:
+                # Uma carga anterior pode ter terminado enquanto esperávamos
+                if self.dataset is not None:
+                    return self.dataset
+                return self.publish(loader())
+
+        return self.flights.do(FULL_REFRESH, load_once)
+
+    def refresh(self, loader: Callable[[], LeadDataset]) -> LeadDataset:
+        """Carrega e publica uma nova versão; a atual segue servida até a troca
+
+        Se já houver uma carga completa em andamento, espera por ela e
+        devolve o seu resultado em vez de iniciar outra.
+        """
+        return self.flights.do(FULL_REFRESH, lambda: self.load_and_publish(loader))
+
+    def refresh_partial(self, key: Hashable, loader: Callable[[], LeadDataset]) -> LeadDataset:
+        """Atualização parcial (ex.: um vendedor), deduplicada por key
+
+        Se uma carga completa estiver em andamento, espera por ela e devolve o
+        seu resultado, que já inclui os dados desse vendedor.
+        """
+        return self.flights.do(key, lambda: self.load_and_publish(loader), covered_by=(FULL_REFRESH,))
+
+    def load_and_publish(self, loader: Callable[[], LeadDataset]) -> LeadDataset:
+        with self.load_lock:
+            return self.publish(loader())
+
+    def refreshing(self) -> bool:
+        """Há uma carga completa em andamento?"""
+        return self.flights.in_flight(FULL_REFRESH)
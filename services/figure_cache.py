@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+from config.settings import settings
+
+# Propriedades de trace que carregam os dados (o resto é layout de tamanho fixo)
+DATA_PROPERTIES = ["x", "y", "labels", "values", "text", "customdata"]
+
+
+class FigureCache:
+    """Cache LRU de figuras Plotly, compartilhado pelo processo
+
+    As chaves são (versão do dataset, gráfico, filtros). As figuras ficam como
+    objetos (sem pickle/JSON); o cache remove as menos usadas quando passa de
+    max_entries ou do limite de memória estimado (max_bytes).
+    """
+
+    # Custo aproximado por ponto e por figura (layout, traces vazios)
+    BYTES_PER_POINT = 64
+    BASE_FIGURE_BYTES = 16 * 1024
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None):
+        self.max_entries = settings.FIGURE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = int(settings.FIGURE_CACHE_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def estimate_size(cls, fig) -> int:
+        """Tamanho aproximado da figura, sem serializá-la"""
+        points = 0
+        for trace in fig.data:
+            for prop in DATA_PROPERTIES:
+                values = trace[prop] if prop in trace else None
+                if values is not None and not isinstance(values, str):
+                    points += len(values)
+        return cls.BASE_FIGURE_BYTES + points * cls.BYTES_PER_POINT
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Optional[Any]:
+        """Figura em cache para key, ou build() (None não é guardado)"""
+        with self.lock:
+            fig = self.entries.get(key)
+            if fig is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return fig
+            self.misses += 1
+
+        # Montada fora do lock: outras sessões seguem lendo o cache
+        fig = build()
+        if fig is None:
+            return None
+
+        size = self.estimate_size(fig)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.sizes[key]
+            self.entries[key] = fig
+            self.entries.move_to_end(key)
+            self.sizes[key] = size
+            self.total_bytes += size
+            self.evict()
+        return fig
+
+    def evict(self) -> None:
+        """Remove as figuras menos usadas até caber nos limites (mantém a mais nova)"""
+        while len(self.entries) > 1 and (
+                len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            key, _ = self.entries.popitem(last=False)
+            self.total_bytes -= self.sizes.pop(key)
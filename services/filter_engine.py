@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+
+class FilterEngine:
+    """Índices da tabela de leads para os filtros do dashboard
+
+    Montado uma vez por versão dos dados: vendedor -> posições das linhas e as
+    posições ordenadas por created_date, de modo que um período vira um
+    searchsorted. Os filtros devolvem arrays de posições (sempre crescentes,
+    na ordem original da tabela) em vez de copiar o DataFrame inteiro.
+    """
+
+    def __init__(self, leads: pd.DataFrame):
+        self.size = len(leads)
+
+        self.seller_positions: Dict[str, np.ndarray] = {}
+        if "vendedor" in leads.columns:
+            self.seller_positions = {
+                seller: np.asarray(positions)
+                for seller, positions in leads.groupby("vendedor", observed=True).indices.items()
+            }
+
+        # Leads sem created_date ficam fora do índice (nunca entram num período)
+        self.date_order = np.array([], dtype=np.intp)
+        self.sorted_dates = np.array([], dtype="datetime64[ns]")
+        if "created_date" in leads.columns:
+            dates = leads["created_date"].to_numpy(dtype="datetime64[ns]")
+            dated = np.flatnonzero(~np.isnat(dates))
+            self.date_order = dated[np.argsort(dates[dated], kind="stable")]
+            self.sorted_dates = dates[self.date_order]
+
+    def date_positions(self, start_date, end_date) -> np.ndarray:
+        """Posições com start_date <= created_date <= end_date"""
+        start = np.datetime64(pd.Timestamp(start_date), "ns")
+        end = np.datetime64(pd.Timestamp(end_date), "ns")
+        first = np.searchsorted(self.sorted_dates, start, side="left")
+        last = np.searchsorted(self.sorted_dates, end, side="right")
+        return np.sort(self.date_order[first:last])
+
+    def positions(self, vendedor: str = None, date_range: tuple = None) -> Optional[np.ndarray]:
+        """Posições das linhas que passam nos filtros (None = todas)"""
+        positions = None
+
+        if vendedor and vendedor != "Todos":
+            positions = self.seller_positions.get(
+                vendedor, np.array([], dtype=np.intp))
+
+        if date_range and len(date_range) == 2:
+            in_range = self.date_positions(*date_range)
+            positions = in_range if positions is None else np.intersect1d(
+                positions, in_range, assume_unique=True)
+
+        return positions
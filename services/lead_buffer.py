@@ -0,0 +1,49 @@
+import pandas as pd
+from typing import List, Dict, Any
+
+# Colunas preenchidas a partir das propriedades do Notion
+LEAD_FIELDS = ["data", "nome", "telefone", "curso", "status"]
+
+# Colunas fixas da tabela de leads, na ordem em que aparecem no DataFrame
+LEAD_COLUMNS = [
+    "vendedor",
+    "database",
+    "lead_id",
+    "created_time",
+    "last_edited_time",
+] + LEAD_FIELDS
+
+
+class LeadColumnBuffer:
+    """Acumula leads em colunas (uma lista por campo) em vez de dicionários
+
+    Cada página extraída é copiada para as colunas e descartada, então só o
+    buffer colunar cresce com o tamanho do database.
+    """
+
+    def __init__(self):
+        self.columns: Dict[str, List[Any]] = {
+            column: [] for column in LEAD_COLUMNS}
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def extend(self, columns: Dict[str, List[Any]]) -> None:
+        """Adiciona um lote de leads já em colunas (todas com o mesmo tamanho)"""
+        size = len(columns["lead_id"])
+        for column in columns:
+            if column not in self.columns:
+                self.columns[column] = [None] * self.size
+
+        for column, values in self.columns.items():
+            values.extend(columns.get(column, [None] * size))
+
+        self.size += size
+
+    def to_frame(self) -> pd.DataFrame:
+        """Converte o buffer em DataFrame, liberando as listas"""
+        frame = pd.DataFrame(self.columns, columns=list(self.columns))
+        self.columns = {column: [] for column in LEAD_COLUMNS}
+        self.size = 0
+        return frame
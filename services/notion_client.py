@@ -1,130 +1,452 @@
-from notion_client import Client
+import asyncio
+import random
+import threading
+import time
+from datetime import date, timedelta
+import httpx
+from notion_client import Client, AsyncClient
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
 from config.settings import settings
+from services.rate_limiter import RateLimiter
 import pandas as pd
-from typing import List, Dict, Any
+from collections import Counter
+from typing import List, Dict, Any, Callable, Iterator
 
+# ✅ Limitador compartilhado pelo processo: o limite do Notion é por integração,
+# então clientes síncronos e assíncronos consomem do mesmo token bucket
+shared_rate_limiter = RateLimiter(settings.NOTION_REQUESTS_PER_SECOND)
 
-class NotionClient:
-    def __init__(self):
+# ✅ Extração por tipo de propriedade do Notion (tabela de despacho)
+PROPERTY_EXTRACTORS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "title": lambda prop: prop["title"][0].get("plain_text", "") if prop.get("title") else "",
+    "rich_text": lambda prop: prop["rich_text"][0].get("plain_text", "") if prop.get("rich_text") else "",
+    "select": lambda prop: prop["select"].get("name", "") if prop.get("select") else "",
+    "status": lambda prop: prop["status"].get("name", "") if prop.get("status") else "",
+    "multi_select": lambda prop: [item.get("name", "") for item in prop.get("multi_select", [])],
+    "number": lambda prop: prop["number"] if prop.get("number") is not None else 0,
+    "date": lambda prop: prop["date"].get("start", "") if prop.get("date") else "",
+    "people": lambda prop: [person.get("name", "") for person in prop.get("people", [])],
+    "phone_number": lambda prop: prop["phone_number"] if prop.get("phone_number") is not None else "",
+    "url": lambda prop: prop["url"] if prop.get("url") is not None else "",
+}
+
+DATABASE_SEARCH_FILTER = {
+    "property": "object",
+    "value": "database"
+}
+
+PAGE_SEARCH_FILTER = {
+    "property": "object",
+    "value": "page"
+}
+
+# Busca das páginas editadas mais recentemente primeiro
+RECENTLY_EDITED_SORT = {
+    "direction": "descending",
+    "timestamp": "last_edited_time"
+}
+
+# Respostas que indicam falha temporária (vale a pena tentar de novo)
+RETRYABLE_STATUS = {409, 429, 500, 502, 503, 504}
+
+
+class BaseNotionClient:
+    """Lógica comum aos clientes síncrono e assíncrono"""
+
+    def __init__(self, rate_limiter: RateLimiter = None):
+        self.rate_limiter = rate_limiter or shared_rate_limiter
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Zera os contadores (o cliente vive o processo inteiro; cada carga
+        começa do zero)"""
+        with self._stats_lock:
+            self.unhandled_property_types = Counter()
+
+            # Contadores do agendador de requisições
+            self.request_stats = {
+                "requests": 0,             # chamadas enviadas ao Notion
+                "retries": 0,              # novas tentativas após falha temporária
+                "rate_limited": 0,         # respostas HTTP 429
+                "throttled_seconds": 0.0,  # tempo esperando Retry-After/backoff
+                "limiter_wait_seconds": 0.0  # tempo esperando o token bucket local
+            }
+
+    def _add_stats(self, **increments) -> None:
+        with self._stats_lock:
+            for key, value in increments.items():
+                self.request_stats[key] += value
+
+    def get_request_stats(self) -> Dict[str, Any]:
+        """Cópia dos contadores de requisições, retentativas e throttling"""
+        with self._stats_lock:
+            return dict(self.request_stats)
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """Verifica se o erro é temporário (rate limit, 5xx, timeout, rede)"""
+        if isinstance(error, HTTPResponseError):
+            return error.status in RETRYABLE_STATUS
+        return isinstance(error, (RequestTimeoutError, httpx.TransportError))
+
+    @staticmethod
+    def is_rate_limited(error: Exception) -> bool:
+        """Verifica se o erro é um HTTP 429 (limite da integração)"""
+        return isinstance(error, HTTPResponseError) and error.status == 429
+
+    @staticmethod
+    def retry_delay(error: Exception, attempt: int) -> float:
+        """Espera antes da próxima tentativa: Retry-After (limitado a
+        NOTION_RETRY_MAX_DELAY) ou backoff exponencial com jitter"""
+        if isinstance(error, HTTPResponseError):
+            retry_after = error.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(float(retry_after), settings.NOTION_RETRY_MAX_DELAY)
+                except ValueError:
+                    pass
+
+        backoff = min(settings.NOTION_RETRY_MAX_DELAY,
+                      settings.NOTION_RETRY_BASE_DELAY * (2 ** attempt))
+        return random.uniform(backoff / 2, backoff)
+
+    def _register_failure(self, error: Exception, attempt: int) -> float:
+        """Decide se a falha será repetida; retorna a espera ou relança o erro"""
+        if attempt >= settings.NOTION_MAX_RETRIES or not self.is_retryable(error):
+            raise error
+
+        delay = self.retry_delay(error, attempt)
+        self._add_stats(retries=1, rate_limited=int(self.is_rate_limited(error)),
+                        throttled_seconds=delay)
+        print(
+            f"⏳ Falha temporária no Notion ({error}). Tentativa {attempt + 2} em {delay:.1f}s")
+        return delay
+
+    @staticmethod
+    def build_search_params(next_cursor: str = None, search_filter: Dict[str, Any] = None,
+                            sort: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Monta os parâmetros de uma página da busca (por padrão, por databases)"""
+        search_params = {
+            "filter": search_filter or DATABASE_SEARCH_FILTER,
+            "page_size": 100  # Máximo por página
+        }
+
+        if next_cursor:
+            search_params["start_cursor"] = next_cursor
+
+        if sort:
+            search_params["sort"] = sort
+
+        return search_params
+
+    @staticmethod
+    def build_query_params(database_id: str, next_cursor: str = None,
+                           query_filter: Dict[str, Any] = None,
+                           filter_properties: List[str] = None) -> Dict[str, Any]:
+        """Monta os parâmetros de uma página de databases.query"""
+        query_params = {
+            "database_id": database_id,
+            "page_size": 100  # Máximo por página
+        }
+
+        # Adicionar cursor se não for a primeira página
+        if next_cursor:
+            query_params["start_cursor"] = next_cursor
+
+        if query_filter:
+            query_params["filter"] = query_filter
+
+        # Projeção: o Notion devolve apenas estas propriedades (IDs do schema)
+        if filter_properties:
+            query_params["filter_properties"] = filter_properties
+
+        return query_params
+
+    @staticmethod
+    def edited_since_filter(last_edited_time: str) -> Dict[str, Any]:
+        """Filtro do Notion para entradas editadas a partir de um timestamp
+
+        O Notion arredonda last_edited_time para o minuto, por isso usamos
+        on_or_after: entradas repetidas são deduplicadas pelo lead_id.
+        """
+        return {
+            "timestamp": "last_edited_time",
+            "last_edited_time": {"on_or_after": last_edited_time}
+        }
+
+    @staticmethod
+    def created_between_filter(start_date: date, end_date: date) -> Dict[str, Any]:
+        """Filtro do Notion para entradas criadas entre duas datas (inclusive)"""
+        return {
+            "and": [
+                {
+                    "timestamp": "created_time",
+                    "created_time": {"on_or_after": start_date.isoformat()}
+                },
+                {
+                    "timestamp": "created_time",
+                    "created_time": {"before": (end_date + timedelta(days=1)).isoformat()}
+                }
+            ]
+        }
+
+    def extract_property_value(self, property_data: Dict[str, Any]) -> Any:
+        """Extrai valor de uma propriedade do Notion com tratamento de erros"""
+        if not property_data:
+            return ""
+
+        prop_type = property_data.get("type")
+        extractor = PROPERTY_EXTRACTORS.get(prop_type)
+
+        if extractor is None:
+            # Contado em agregado (get_unhandled_property_types), sem print por
+            # valor; os databases são extraídos em várias threads
+            with self._stats_lock:
+                self.unhandled_property_types[prop_type] += 1
+            return ""
+
+        try:
+            return extractor(property_data)
+        except (IndexError, KeyError, AttributeError) as e:
+            print(f"Erro ao extrair propriedade {prop_type}: {e}")
+            return ""
+
+    def extract_columns(self, pages: List[Dict[str, Any]], plan) -> Dict[str, List[Any]]:
+        """Extrai, em uma única passada, as colunas de um plano para várias páginas
+
+        plan é um PropertyPlan: para cada coluna, a propriedade de origem. Os
+        valores mantêm o tipo do Notion (texto, número, data ISO ou lista);
+        a coluna status usa as propriedades de status do plano como reserva.
+        """
+        status_source = plan.field_sources.get("status")
+        sources = [(column, prop_name) for column, prop_name in plan.field_sources.items()
+                   if column != "status"]
+        sources += [(column, prop_name)
+                    for prop_name, column in plan.raw_columns]
+
+        columns = {
+            "lead_id": [],
+            "created_time": [],
+            "last_edited_time": [],
+            "status": []
+        }
+        for column, _ in sources:
+            columns[column] = []
+
+        extract = self.extract_property_value
+
+        for page in pages:
+            properties = page.get("properties", {})
+            columns["lead_id"].append(page.get("id", ""))
+            columns["created_time"].append(page.get("created_time", ""))
+            columns["last_edited_time"].append(
+                page.get("last_edited_time", ""))
+
+            for column, prop_name in sources:
+                columns[column].append(extract(properties.get(prop_name)))
+
+            status = extract(properties.get(status_source)
+                             ) if status_source else ""
+
+            # Se não encontrou status pelos nomes, tentar encontrar por tipo
+            if status is None or status == "":
+                for prop_name in plan.status_fallback:
+                    value = extract(properties.get(prop_name))
+                    if value:
+                        status = value
+                        break
+
+            columns["status"].append(status)
+
+        return columns
+
+    def get_unhandled_property_types(self) -> Dict[str, int]:
+        """Quantas vezes cada tipo de propriedade não tratado foi encontrado"""
+        with self._stats_lock:
+            return dict(self.unhandled_property_types)
+
+
+class NotionClient(BaseNotionClient):
+    def __init__(self, rate_limiter: RateLimiter = None):
+        super().__init__(rate_limiter)
         self.client = Client(auth=settings.NOTION_TOKEN)
 
-    def get_all_databases(self) -> List[Dict[str, Any]]:
-        """Busca todos os databases acessíveis"""
+    def request(self, method, **kwargs) -> Dict[str, Any]:
+        """Executa uma chamada respeitando o rate limit e repetindo falhas temporárias
+
+        Cada página de uma paginação é uma chamada separada, então uma falha
+        no meio de um database retoma a partir do último next_cursor válido.
+        """
+        attempt = 0
+        while True:
+            waited = self.rate_limiter.acquire()
+            self._add_stats(requests=1, limiter_wait_seconds=waited)
+            try:
+                return method(**kwargs)
+            except Exception as e:
+                delay = self._register_failure(e, attempt)
+                attempt += 1
+                if self.is_rate_limited(e):
+                    # O limite é da integração: as outras threads também esperam
+                    self.rate_limiter.pause(delay)
+                time.sleep(delay)
+
+    def iter_databases(self, raise_errors: bool = False) -> Iterator[Dict[str, Any]]:
+        """Percorre todos os databases acessíveis, página a página da busca
+
+        Com raise_errors=True, uma falha que persiste após as retentativas é
+        propagada, para quem precisa saber se a busca chegou ao fim.
+        """
+        has_more = True
+        next_cursor = None
+
         try:
-            response = self.client.search(
-                filter={
-                    "property": "object",
-                    "value": "database"
-                }
-            )
-            return response.get("results", [])
+            while has_more:
+                response = self.request(
+                    self.client.search, **self.build_search_params(next_cursor))
+
+                yield from response.get("results", [])
+
+                has_more = response.get("has_more", False)
+                next_cursor = response.get("next_cursor")
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Erro ao buscar databases: {e}")
-            return []
 
-    def get_database_entries(self, database_id: str) -> List[Dict[str, Any]]:
-        """Busca TODAS as entradas de um database (sem limitação de 100)"""
-        all_entries = []
+    def iter_recently_edited_pages(self) -> Iterator[Dict[str, Any]]:
+        """Percorre as páginas acessíveis, das editadas mais recentemente
+        para as mais antigas
+
+        Quem consome para de iterar ao chegar no período que já conhece, então
+        só as páginas necessárias são buscadas. Erros são propagados.
+        """
         has_more = True
         next_cursor = None
 
-        print(
-            f"DEBUG: Iniciando busca de entradas para database {database_id}")
+        while has_more:
+            response = self.request(
+                self.client.search, **self.build_search_params(
+                    next_cursor, PAGE_SEARCH_FILTER, RECENTLY_EDITED_SORT))
 
-        try:
-            while has_more:
-                # Preparar parâmetros da query
-                query_params = {
-                    "database_id": database_id,
-                    "page_size": 100  # Máximo por página
-                }
+            yield from response.get("results", [])
 
-                # Adicionar cursor se não for a primeira página
-                if next_cursor:
-                    query_params["start_cursor"] = next_cursor
+            has_more = response.get("has_more", False)
+            next_cursor = response.get("next_cursor")
 
-                # Fazer a query
-                response = self.client.databases.query(**query_params)
+    def iter_database_pages(self, database_id: str, query_filter: Dict[str, Any] = None,
+                            filter_properties: List[str] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Percorre as entradas de um database, uma página (até 100) por vez
 
-                # Adicionar resultados à lista
-                page_results = response.get("results", [])
-                all_entries.extend(page_results)
+        Erros que persistem após as retentativas são propagados: quem consome
+        decide o que fazer com as páginas já processadas. Se o Notion recusar
+        a projeção (HTTP 400), a busca segue sem filter_properties.
+        """
+        has_more = True
+        next_cursor = None
+        total = 0
 
-                # Verificar se há mais páginas
-                has_more = response.get("has_more", False)
-                next_cursor = response.get("next_cursor")
+        while has_more:
+            # Preparar parâmetros da query
+            query_params = self.build_query_params(
+                database_id, next_cursor, query_filter, filter_properties)
 
+            # Fazer a query
+            try:
+                response = self.request(
+                    self.client.databases.query, **query_params)
+            except HTTPResponseError as e:
+                if e.status != 400 or not filter_properties:
+                    raise
                 print(
-                    f"DEBUG: Página processada - {len(page_results)} entradas. Total acumulado: {len(all_entries)}. Há mais páginas: {has_more}")
+                    f"⚠️ filter_properties recusado no database {database_id} ({e}); buscando todas as propriedades")
+                filter_properties = None
+                continue
 
-        except Exception as e:
-            print(f"Erro ao buscar entradas do database {database_id}: {e}")
-            return []
+            page_results = response.get("results", [])
+            total += len(page_results)
 
-        print(
-            f"DEBUG: Busca finalizada - Total de {len(all_entries)} entradas encontradas para database {database_id}")
-        return all_entries
+            # Verificar se há mais páginas
+            has_more = response.get("has_more", False)
+            next_cursor = response.get("next_cursor")
+
+            print(
+                f"DEBUG: Página processada - {len(page_results)} entradas. Total acumulado: {total}. Há mais páginas: {has_more}")
+
+            yield page_results
 
     def get_database_info(self, database_id: str) -> Dict[str, Any]:
         """Busca informações de um database"""
         try:
-            return self.client.databases.retrieve(database_id=database_id)
+            return self.request(self.client.databases.retrieve, database_id=database_id)
         except Exception as e:
             print(f"Erro ao buscar info do database {database_id}: {e}")
             return {}
 
-    def extract_property_value(self, property_data: Dict[str, Any]) -> Any:
-        """Extrai valor de uma propriedade do Notion com tratamento de erros"""
-        if not property_data:
-            return ""
+    def get_page(self, page_id: str) -> Dict[str, Any]:
+        """Busca uma página (ex.: página pai de um database)"""
+        return self.request(self.client.pages.retrieve, page_id=page_id)
 
-        prop_type = property_data.get("type")
 
-        try:
-            if prop_type == "title":
-                title_list = property_data.get("title", [])
-                return title_list[0].get("plain_text", "") if title_list else ""
+class AsyncNotionClient(BaseNotionClient):
+    """Variante asyncio do NotionClient, baseada em notion_client.AsyncClient
 
-            elif prop_type == "rich_text":
-                rich_text_list = property_data.get("rich_text", [])
-                return rich_text_list[0].get("plain_text", "") if rich_text_list else ""
+    Para lotes de chamadas independentes (ex.: as páginas pai dos databases
+    em SellerNameResolver.resolve_many): um único event loop dispara todas,
+    as conexões HTTP são reaproveitadas por um pool httpx e as requisições em
+    andamento consomem do mesmo token bucket dos clientes síncronos. Deve ser
+    criada e fechada dentro do event loop que a usa (async with).
+    """
 
-            elif prop_type == "select":
-                select_data = property_data.get("select")
-                return select_data.get("name", "") if select_data else ""
+    def __init__(self, rate_limiter: RateLimiter = None, max_connections: int = None):
+        super().__init__(rate_limiter)
+        if max_connections is None:
+            max_connections = settings.NOTION_MAX_CONNECTIONS
 
-            elif prop_type == "status":
-                status_data = property_data.get("status")
-                return status_data.get("name", "") if status_data else ""
-
-            elif prop_type == "multi_select":
-                multi_select_list = property_data.get("multi_select", [])
-                return [item.get("name", "") for item in multi_select_list]
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+        self.client = AsyncClient(
+            auth=settings.NOTION_TOKEN, client=self.http_client)
 
-            elif prop_type == "number":
-                number_value = property_data.get("number")
-                return number_value if number_value is not None else 0
+    async def request(self, method, **kwargs) -> Dict[str, Any]:
+        """Executa uma chamada respeitando o rate limit e repetindo falhas temporárias"""
+        attempt = 0
+        while True:
+            waited = await self.rate_limiter.acquire_async()
+            self._add_stats(requests=1, limiter_wait_seconds=waited)
+            try:
+                return await method(**kwargs)
+            except Exception as e:
+                delay = self._register_failure(e, attempt)
+                attempt += 1
+                if self.is_rate_limited(e):
+                    # O limite é da integração: as outras requisições também esperam
+                    self.rate_limiter.pause(delay)
+                await asyncio.sleep(delay)
 
-            elif prop_type == "date":
-                date_data = property_data.get("date")
-                return date_data.get("start", "") if date_data else ""
+    async def __aenter__(self) -> "AsyncNotionClient":
+        return self
 
-            elif prop_type == "people":
-                people_list = property_data.get("people", [])
-                return [person.get("name", "") for person in people_list]
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.aclose()
 
-            elif prop_type == "phone_number":
-                phone_value = property_data.get("phone_number")
-                return phone_value if phone_value is not None else ""
+    async def aclose(self) -> None:
+        """Fecha o pool de conexões"""
+        await self.http_client.aclose()
 
-            elif prop_type == "url":
-                url_value = property_data.get("url")
-                return url_value if url_value is not None else ""
+    async def get_page(self, page_id: str) -> Dict[str, Any]:
+        """Busca uma página (ex.: página pai de um database)"""
+        return await self.request(self.client.pages.retrieve, page_id=page_id)
 
-            else:
-                print(f"DEBUG: Tipo de propriedade não tratado: '{prop_type}'")
-                return ""
+    async def get_pages(self, page_ids: List[str]) -> List[Any]:
+        """Busca várias páginas concorrentemente, na ordem de page_ids
 
-        except (IndexError, KeyError, AttributeError) as e:
-            print(f"Erro ao extrair propriedade {prop_type}: {e}")
-            return ""
+        Uma falha não cancela as demais: a exceção ocupa a posição da página.
+        """
+        return await asyncio.gather(
+            *(self.get_page(page_id) for page_id in page_ids), return_exceptions=True)
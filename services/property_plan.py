@@ -0,0 +1,73 @@
+import hashlib
+import json
+from typing import List, Dict, Any, Optional, Tuple
+
+# ✅ Palavras-chave que mapeiam o nome da propriedade para a coluna do lead
+# (a ordem importa: a primeira regra que casar define a coluna)
+FIELD_KEYWORDS = [
+    ("data", ["data", "date"]),
+    ("nome", ["nome", "name", "cliente"]),
+    ("telefone", ["telefone", "phone", "tel", "fone"]),
+    ("curso", ["curso", "course", "produto"]),
+    ("status", ["status", "etapa", "stage"]),
+]
+
+
+def match_lead_field(prop_name: str) -> Optional[str]:
+    """Coluna do lead correspondente ao nome de uma propriedade do Notion"""
+    prop_name_lower = prop_name.lower()
+    for lead_field, keywords in FIELD_KEYWORDS:
+        if any(keyword in prop_name_lower for keyword in keywords):
+            return lead_field
+    return None
+
+
+def schema_hash(properties: Dict[str, Dict[str, Any]]) -> str:
+    """Impressão digital do schema (nome, id e tipo de cada propriedade)
+
+    Muda quando uma propriedade é criada, renomeada, removida ou muda de tipo,
+    ou seja, quando o PropertyPlan do database pode mudar.
+    """
+    fields = sorted(
+        (prop_name, prop.get("id", ""), prop.get("type", ""))
+        for prop_name, prop in properties.items()
+    )
+    return hashlib.sha1(json.dumps(fields).encode("utf-8")).hexdigest()
+
+
+class PropertyPlan:
+    """Mapeamento pré-compilado das propriedades de um database para as colunas do lead
+
+    O casamento por palavras-chave é feito uma vez por database (a partir do
+    schema ou da primeira entrada) e reaplicado a todas as linhas.
+    """
+
+    def __init__(self, field_sources: Dict[str, str], status_fallback: List[str],
+                 raw_columns: List[Tuple[str, str]]):
+        # Coluna do lead -> propriedade de origem (a última que casar, como na
+        # extração original, em que cada propriedade sobrescrevia a anterior)
+        self.field_sources = field_sources
+        # Propriedades do tipo status, usadas se a coluna status ficar vazia
+        self.status_fallback = status_fallback
+        # (propriedade, coluna prop_*) quando INCLUDE_RAW_PROPERTIES está ativo
+        self.raw_columns = raw_columns
+
+    @classmethod
+    def compile(cls, properties: Dict[str, Dict[str, Any]], include_raw: bool = False) -> "PropertyPlan":
+        """Compila o plano a partir de propriedades (de uma entrada ou do schema)"""
+        field_sources = {}
+        status_fallback = []
+        raw_columns = []
+
+        for prop_name, prop_data in properties.items():
+            lead_field = match_lead_field(prop_name)
+            if lead_field:
+                field_sources[lead_field] = prop_name
+
+            if prop_data.get("type") == "status":
+                status_fallback.append(prop_name)
+
+            if include_raw:
+                raw_columns.append((prop_name, f"prop_{prop_name.lower()}"))
+
+        return cls(field_sources, status_fallback, raw_columns)
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket compartilhado para respeitar o limite de requisições do Notion
+
+    Cada chamada reserva um token (o saldo pode ficar negativo) e espera o tempo
+    correspondente. Assim as requisições são escalonadas em ordem de chegada,
+    tanto em threads (acquire) quanto em corrotinas (acquire_async).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._last_refill = now
+
+    def _reserve(self) -> float:
+        """Reserva um token e retorna quanto tempo é preciso esperar por ele"""
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+
+            return -self._tokens / self.rate
+
+    def acquire(self) -> float:
+        """Bloqueia até o token reservado estar disponível; retorna o tempo esperado"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        """Versão asyncio de acquire: não bloqueia o event loop enquanto espera"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def pause(self, delay: float) -> None:
+        """Adia o próximo token em delay segundos para todos os chamadores
+
+        Usado quando o Notion responde 429: o limite é da integração, então
+        as requisições das outras threads e corrotinas também precisam esperar.
+        """
+        if self.rate <= 0 or delay <= 0:
+            return
+
+        with self._lock:
+            self._refill()
+            # Com este saldo, o próximo token só fica disponível após delay
+            self._tokens = min(self._tokens, 1 - delay * self.rate)
@@ -0,0 +1,106 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from services.dataset import LeadDataset
+from services.dataset_store import DatasetStore
+
+
+class RefreshWorker:
+    """Atualiza o DatasetStore numa thread em segundo plano
+
+    Roda a cada interval_seconds (contados a partir de synced_at da versão
+    atual, então um snapshot antigo é revalidado logo na partida) ou quando
+    request_refresh é chamado. Enquanto a carga acontece as sessões seguem
+    lendo a versão atual; a nova é publicada de uma vez ao terminar.
+    """
+
+    def __init__(self, store: DatasetStore, loader: Callable[[], LeadDataset], interval_seconds: float = 0):
+        self.store = store
+        self.loader = loader
+        self.interval_seconds = interval_seconds
+        self.requested = threading.Event()
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+        # Estado exibido na barra lateral
+        self.running = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        """Inicia a thread (idempotente)"""
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.stopped.clear()
+            self.thread = threading.Thread(
+                target=self.run, name="dataset-refresh", daemon=True)
+            self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.requested.set()
+
+    def request_refresh(self) -> None:
+        """Pede uma atualização imediata
+
+        Cliques enquanto uma carga completa já está rodando se juntam a ela
+        (o resultado dela é publicado para todos) em vez de enfileirar outra.
+        """
+        if self.store.refreshing():
+            return
+        self.requested.set()
+        self.start()
+
+    def seconds_until_due(self) -> Optional[float]:
+        """Tempo até a próxima atualização periódica (None = só sob demanda)"""
+        if self.interval_seconds <= 0:
+            return None
+        dataset = self.store.current()
+        if dataset is None:
+            # A primeira carga é feita pela sessão que abrir o app
+            return self.interval_seconds
+        last_attempt = dataset.synced_at
+        if self.last_error and self.finished_at:
+            # Depois de uma falha, espera o intervalo antes de tentar de novo
+            last_attempt = max(last_attempt, self.finished_at)
+        return max(0.0, last_attempt + self.interval_seconds - time.time())
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            requested = self.requested.wait(timeout=self.seconds_until_due())
+            if self.stopped.is_set():
+                break
+
+            due = self.seconds_until_due()
+            if requested or (due is not None and due <= 0 and self.store.current() is not None):
+                self.requested.clear()
+                self.refresh()
+
+    def refresh(self) -> None:
+        """Executa uma atualização na thread atual"""
+        self.running = True
+        self.started_at = time.time()
+        try:
+            dataset = self.store.refresh(self.loader)
+            self.last_error = None
+            print(
+                f"🔄 Dataset v{dataset.version} publicado em {time.time() - self.started_at:.1f}s")
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Erro na atualização em segundo plano: {e}")
+        finally:
+            self.running = False
+            self.finished_at = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        """Situação da atualização: running, queued, started_at, finished_at, last_error"""
+        return {
+            "running": self.running or self.store.refreshing(),
+            "queued": self.requested.is_set(),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "last_error": self.last_error
+        }
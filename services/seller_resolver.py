@@ -0,0 +1,202 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+from config.settings import settings
+from services.notion_client import AsyncNotionClient
+
+
+class SellerNameResolver:
+    """Resolve o título da página pai de cada database (nome do vendedor)
+
+    Os títulos ficam em um cache persistente por page_id, com o
+    last_edited_time da página. A cada carga, check_changes descobre numa
+    busca só quais páginas foram editadas e apenas essas voltam a ser
+    consultadas; SELLER_NAME_TTL_HOURS só vale quando essa verificação falha.
+    """
+
+    def __init__(self, notion_client, cache_path: str = None, ttl_hours: float = None):
+        self.notion_client = notion_client
+        self.cache_path = cache_path or settings.SELLER_NAME_CACHE_PATH
+        self.ttl_hours = settings.SELLER_NAME_TTL_HOURS if ttl_hours is None else ttl_hours
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.cache: Dict[str, Dict[str, Any]] = self._load()
+        # Início da última verificação de alterações (check_changes)
+        self.changes_checked_at: Optional[float] = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.cache_path):
+            return {}
+
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao ler cache de vendedores: {e}")
+            return {}
+
+    def save(self) -> None:
+        """Grava o cache em disco se houve alterações"""
+        with self._lock:
+            if not self._dirty:
+                return
+            cache = dict(self.cache)
+            self._dirty = False
+
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Erro ao gravar cache de vendedores: {e}")
+
+    def _is_fresh(self, cached: Dict[str, Any]) -> bool:
+        return (time.time() - cached.get("checked_at", 0)) / 3600 <= self.ttl_hours
+
+    def _fetch(self, page_id: str) -> Optional[str]:
+        """Consulta a página no Notion e atualiza o cache"""
+        try:
+            page_info = self.notion_client.get_page(page_id)
+        except Exception as e:
+            print(f"Erro ao buscar info da página {page_id} para vendedor: {e}")
+            return None
+
+        return self._store(page_id, page_info)
+
+    async def _fetch_many(self, page_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Consulta várias páginas num único event loop e atualiza o cache"""
+        async with AsyncNotionClient(self.notion_client.rate_limiter) as client:
+            pages = await client.get_pages(page_ids)
+
+        # As requisições entram nos contadores do cliente principal
+        self.notion_client._add_stats(**client.get_request_stats())
+
+        titles = {}
+        for page_id, page_info in zip(page_ids, pages):
+            if isinstance(page_info, BaseException):
+                print(
+                    f"Erro ao buscar info da página {page_id} para vendedor: {page_info}")
+                titles[page_id] = None
+            else:
+                titles[page_id] = self._store(page_id, page_info)
+        return titles
+
+    def _store(self, page_id: str, page_info: Dict[str, Any]) -> str:
+        """Guarda no cache o título de uma página retornada pelo Notion"""
+        page_title_prop = page_info.get("properties", {}).get("title", {})
+        title = self.notion_client.extract_property_value(
+            page_title_prop) if page_title_prop else ""
+        with self._lock:
+            self.cache[page_id] = {
+                "title": title,
+                "last_edited_time": page_info.get("last_edited_time"),
+                "checked_at": time.time()
+            }
+            self._dirty = True
+
+        return title
+
+    def check_changes(self) -> None:
+        """Marca para nova consulta as páginas editadas desde a última verificação
+
+        Percorre a busca de páginas do Notion das editadas mais recentemente
+        para as mais antigas e para no início da verificação anterior, então o
+        custo acompanha o volume de edições. Páginas com last_edited_time
+        diferente do cache são consultadas de novo no próximo resolve; as
+        demais são renovadas sem nenhuma requisição.
+
+        A busca também devolve as entradas dos CRMs (linhas de database são
+        páginas). Se a última verificação for mais antiga que o TTL ou a busca
+        passar de SELLER_NAME_SCAN_MAX_PAGES páginas de resultados, consultar
+        de novo as páginas dos vendedores sai mais barato: todas são expiradas.
+        """
+        with self._lock:
+            since = self.changes_checked_at
+            if since is None:
+                checked = [cached.get("checked_at", 0) for cached in self.cache.values()
+                           if cached.get("checked_at", 0) > 0]
+                since = min(checked) if checked else None
+        if since is None:
+            return
+
+        started_at = time.time()
+        if (started_at - since) / 3600 > self.ttl_hours:
+            self._expire_all(started_at)
+            return
+
+        # O Notion arredonda last_edited_time para o minuto
+        since_minute = datetime.fromtimestamp(
+            since, timezone.utc).strftime("%Y-%m-%dT%H:%M")
+
+        max_results = settings.SELLER_NAME_SCAN_MAX_PAGES * 100
+        edited = {}
+        try:
+            pages = self.notion_client.iter_recently_edited_pages()
+            for scanned, page in enumerate(pages):
+                last_edited_time = page.get("last_edited_time") or ""
+                if last_edited_time[:16] < since_minute:
+                    break
+                if scanned >= max_results:
+                    print(
+                        f"⚠️ Mais de {max_results} páginas editadas desde a última verificação; nomes de vendedores serão buscados de novo")
+                    self._expire_all(started_at)
+                    return
+                edited.setdefault(page.get("id"), last_edited_time)
+        except Exception as e:
+            print(f"Erro ao verificar alterações nas páginas dos vendedores: {e}")
+            return
+
+        with self._lock:
+            for page_id, cached in self.cache.items():
+                if page_id in edited and edited[page_id] != cached.get("last_edited_time"):
+                    cached["checked_at"] = 0
+                elif cached.get("checked_at", 0) > 0:
+                    cached["checked_at"] = started_at
+            self._dirty = True
+            self.changes_checked_at = started_at
+
+    def resolve(self, page_id: str) -> Optional[str]:
+        """Título da página (pode ser vazio); None se não foi possível buscar"""
+        with self._lock:
+            cached = self.cache.get(page_id)
+
+        if cached and self._is_fresh(cached):
+            return cached["title"]
+
+        return self._fetch(page_id)
+
+    def resolve_many(self, page_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Resolve vários títulos, buscando as ausências/expiradas concorrentemente
+
+        As páginas que faltam são buscadas pelo AsyncNotionClient, todas no
+        mesmo event loop.
+        """
+        results = {}
+        misses = []
+        with self._lock:
+            for page_id in dict.fromkeys(page_ids):
+                cached = self.cache.get(page_id)
+                if cached and self._is_fresh(cached):
+                    results[page_id] = cached["title"]
+                else:
+                    misses.append(page_id)
+
+        if misses:
+            results.update(asyncio.run(self._fetch_many(misses)))
+            self.save()
+
+        return results
+
+    def _expire_all(self, checked_at: float) -> None:
+        """Expira todos os títulos: cada página é consultada de novo no próximo resolve"""
+        with self._lock:
+            for cached in self.cache.values():
+                cached["checked_at"] = 0
+            self._dirty = True
+            self.changes_checked_at = checked_at
@@ -0,0 +1,55 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable
+
+
+class Flight:
+    """Uma execução em andamento e o resultado compartilhado com quem esperou"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """Deduplica execuções concorrentes por chave
+
+    A primeira chamada de do(key, fn) executa fn; as que chegam enquanto ela
+    roda esperam e recebem o mesmo resultado (ou a mesma exceção). covered_by
+    lista chaves mais amplas que também atendem o pedido: uma atualização de
+    um vendedor se junta a uma atualização completa que já esteja em voo.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights: Dict[Hashable, Flight] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        with self.lock:
+            return key in self.flights
+
+    def do(self, key: Hashable, fn: Callable[[], Any], covered_by: Iterable[Hashable] = ()) -> Any:
+        with self.lock:
+            flight = next((self.flights[k] for k in (key, *covered_by)
+                           if k in self.flights), None)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self.flights[key] = flight
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
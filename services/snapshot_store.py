@@ -0,0 +1,198 @@
+import json
+import os
+import time
+import pandas as pd
+from typing import List, Dict, Any, Iterator, Optional
+from config.settings import settings
+
+
+class SnapshotStore:
+    """Snapshots em disco dos dados do Notion
+
+    Guarda as entradas brutas de cada database (JSON Lines em raw/<id>.jsonl),
+    a tabela de leads processada (leads.parquet) e um manifest.json com a
+    versão do snapshot, o horário de gravação e o estado da sincronização.
+    """
+
+    # Incrementar quando o formato dos arquivos mudar: snapshots antigos são ignorados
+    FORMAT_VERSION = 1
+
+    def __init__(self, directory: str = None, max_age_hours: float = None):
+        self.directory = directory or settings.SNAPSHOT_DIR
+        self.max_age_hours = settings.SNAPSHOT_MAX_AGE_HOURS if max_age_hours is None else max_age_hours
+        self.raw_directory = os.path.join(self.directory, "raw")
+        self.manifest_path = os.path.join(self.directory, "manifest.json")
+        self.leads_path = os.path.join(self.directory, "leads.parquet")
+
+    def _raw_path(self, database_id: str) -> str:
+        return os.path.join(self.raw_directory, f"{database_id}.jsonl")
+
+    @staticmethod
+    def _atomic_write(path: str, write) -> None:
+        """Grava em arquivo temporário e substitui o destino de uma vez"""
+        tmp_path = f"{path}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def save_raw_entries(self, database_id: str, entries: List[Dict[str, Any]], merge: bool = False) -> None:
+        """Grava as entradas brutas de um database; com merge=True mescla pelo id"""
+        os.makedirs(self.raw_directory, exist_ok=True)
+
+        if merge:
+            merged = {entry.get("id"): entry for entry in self.load_raw_entries(database_id)}
+            for entry in entries:
+                merged[entry.get("id")] = entry
+            entries = list(merged.values())
+
+        def write(path):
+            with open(path, "w", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False))
+                    f.write("\n")
+
+        self._atomic_write(self._raw_path(database_id), write)
+
+    def iter_raw_entries(self, database_id: str) -> Iterator[Dict[str, Any]]:
+        """Percorre as entradas brutas gravadas para um database, linha a linha"""
+        path = self._raw_path(database_id)
+        if not os.path.exists(path):
+            return
+
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def load_raw_entries(self, database_id: str) -> List[Dict[str, Any]]:
+        """Lê as entradas brutas gravadas para um database"""
+        return list(self.iter_raw_entries(database_id))
+
+    def remove_raw_entries(self, database_id: str) -> None:
+        """Apaga as entradas brutas de um database que deixou de existir"""
+        path = self._raw_path(database_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def load_manifest(self) -> Optional[Dict[str, Any]]:
+        """Lê o manifest; retorna None se não existir ou for de outro formato"""
+        if not os.path.exists(self.manifest_path):
+            return None
+
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao ler manifest do snapshot: {e}")
+            return None
+
+        if manifest.get("format_version") != self.FORMAT_VERSION:
+            print("⚠️ Snapshot em formato antigo ignorado")
+            return None
+
+        return manifest
+
+    def save(self, df: pd.DataFrame, databases: Dict[str, Dict[str, Any]],
+             full_sync_at: float = None) -> int:
+        """Grava a tabela de leads e o manifest; retorna a nova versão
+
+        full_sync_at é o horário da última carga completa, para a carga
+        completa periódica continuar valendo depois de reiniciar o app.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        previous = self.load_manifest()
+        version = (previous["version"] + 1) if previous else 1
+
+        self._atomic_write(
+            self.leads_path, lambda path: df.to_parquet(path, index=False))
+
+        manifest = {
+            "format_version": self.FORMAT_VERSION,
+            "version": version,
+            "saved_at": time.time(),
+            "full_sync_at": full_sync_at,
+            "databases": databases
+        }
+
+        def write(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False)
+
+        self._atomic_write(self.manifest_path, write)
+        return version
+
+    def load(self) -> Optional[pd.DataFrame]:
+        """Lê a tabela de leads do último snapshot"""
+        if not os.path.exists(self.leads_path):
+            return None
+        return pd.read_parquet(self.leads_path)
+
+    def age_hours(self, manifest: Dict[str, Any]) -> float:
+        """Idade do snapshot em horas"""
+        return (time.time() - manifest.get("saved_at", 0)) / 3600
+
+    def is_fresh(self, manifest: Dict[str, Any]) -> bool:
+        """Verifica se o snapshot ainda está dentro da idade máxima"""
+        return self.age_hours(manifest) <= self.max_age_hours
+
+
+class RawEntriesWriter:
+    """Grava as entradas brutas de um database página a página
+
+    Numa carga completa, cada página vai direto para um arquivo temporário,
+    que só substitui o anterior se a busca terminar sem erro. Numa
+    sincronização incremental as poucas entradas alteradas são mescladas no
+    arquivo existente ao final. Com store=None nada é gravado.
+    """
+
+    def __init__(self, store: Optional[SnapshotStore], database_id: str, merge: bool = False):
+        self.store = store
+        self.database_id = database_id
+        self.merge = merge
+        self.pending: List[Dict[str, Any]] = []
+        self._file = None
+        self._path = None
+
+    def __enter__(self) -> "RawEntriesWriter":
+        if self.store and not self.merge:
+            try:
+                os.makedirs(self.store.raw_directory, exist_ok=True)
+                self._path = self.store._raw_path(self.database_id)
+                self._file = open(f"{self._path}.tmp", "w", encoding="utf-8")
+            except OSError as e:
+                print(
+                    f"Erro ao gravar entradas brutas do database {self.database_id}: {e}")
+                self.store = None
+        return self
+
+    def write(self, entries: List[Dict[str, Any]]) -> None:
+        if not self.store:
+            return
+
+        if self.merge:
+            self.pending.extend(entries)
+            return
+
+        for entry in entries:
+            self._file.write(json.dumps(entry, ensure_ascii=False))
+            self._file.write("\n")
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        if not self.store:
+            return False
+
+        try:
+            if self._file:
+                self._file.close()
+                if exc_type is None:
+                    os.replace(f"{self._path}.tmp", self._path)
+                else:
+                    os.remove(f"{self._path}.tmp")
+            elif exc_type is None:
+                self.store.save_raw_entries(
+                    self.database_id, self.pending, merge=True)
+        except OSError as e:
+            print(
+                f"Erro ao gravar entradas brutas do database {self.database_id}: {e}")
+
+        return False
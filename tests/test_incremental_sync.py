@@ -0,0 +1,315 @@
+import copy
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+from config.settings import settings
+from services.data_processor import DataProcessor
+from services.notion_client import shared_rate_limiter
+
+EDITED_AT = "2024-01-10T10:00:00.000Z"
+EDITED_LATER = "2024-02-01T10:00:00.000Z"
+
+
+def make_entry(lead_id, nome, status, edited=EDITED_AT):
+    return {
+        "id": lead_id,
+        "created_time": "2024-01-05T12:00:00.000Z",
+        "last_edited_time": edited,
+        "properties": {
+            "Nome": {"id": "title", "type": "title", "title": [{"plain_text": nome}]},
+            "Telefone": {"id": "tel", "type": "phone_number", "phone_number": "5511999990000"},
+            "Status": {"id": "st", "type": "status", "status": {"name": status}},
+        },
+    }
+
+
+class FakeNotion:
+    """Workspace em memória com a parte do notion_client.Client usada pelo app
+
+    Como no Notion, entradas arquivadas simplesmente somem de databases.query.
+    """
+
+    def __init__(self):
+        self.database_list = {}
+        self.page_list = {}
+        self.entries = {}
+        self.query_calls = []
+        self.page_calls = []
+        self.databases = SimpleNamespace(query=self.query, retrieve=self.retrieve)
+        self.pages = SimpleNamespace(retrieve=self.retrieve_page)
+
+    def add_database(self, database_id, seller, entries):
+        page_id = f"page-{database_id}"
+        self.page_list[page_id] = {
+            "object": "page",
+            "id": page_id,
+            "last_edited_time": EDITED_AT,
+            "properties": {"title": {"type": "title", "title": [{"plain_text": seller}]}},
+        }
+        self.database_list[database_id] = {
+            "object": "database",
+            "id": database_id,
+            "title": [{"plain_text": f"CRM {seller}"}],
+            "last_edited_time": EDITED_AT,
+            "parent": {"type": "page_id", "page_id": page_id},
+            "properties": {
+                name: {"id": prop["id"], "type": prop["type"], "name": name}
+                for name, prop in entries[0]["properties"].items()
+            },
+        }
+        self.entries[database_id] = {entry["id"]: entry for entry in entries}
+
+    def edit(self, database_id, entry):
+        """Cria ou altera uma entrada (o database também passa a constar como editado)"""
+        self.entries[database_id][entry["id"]] = entry
+        self.database_list[database_id]["last_edited_time"] = entry["last_edited_time"]
+
+    def archive(self, database_id, lead_id, edited=EDITED_LATER):
+        del self.entries[database_id][lead_id]
+        self.database_list[database_id]["last_edited_time"] = edited
+
+    def rename(self, database_id, seller, edited=EDITED_LATER):
+        page = self.page_list[self.database_list[database_id]["parent"]["page_id"]]
+        page["properties"]["title"]["title"] = [{"plain_text": seller}]
+        page["last_edited_time"] = edited
+
+    def rename_property(self, database_id, old_name, new_name, edited=EDITED_LATER):
+        for properties in [self.database_list[database_id]["properties"]] + [
+                entry["properties"] for entry in self.entries[database_id].values()]:
+            properties[new_name] = properties.pop(old_name)
+        self.database_list[database_id]["properties"][new_name]["name"] = new_name
+        self.database_list[database_id]["last_edited_time"] = edited
+
+    def search(self, filter=None, start_cursor=None, page_size=100, sort=None):
+        objects = self.page_list if filter and filter["value"] == "page" else self.database_list
+        results = list(objects.values())
+        if sort:
+            results.sort(key=lambda result: result[sort["timestamp"]],
+                         reverse=sort["direction"] == "descending")
+        return {"results": copy.deepcopy(results), "has_more": False, "next_cursor": None}
+
+    def query(self, database_id, filter=None, start_cursor=None, page_size=100, filter_properties=None):
+        self.query_calls.append(database_id)
+        results = [entry for entry in self.entries[database_id].values()
+                   if not filter or entry["last_edited_time"] >= filter["last_edited_time"]["on_or_after"]]
+        return {"results": copy.deepcopy(results), "has_more": False, "next_cursor": None}
+
+    def retrieve(self, database_id):
+        return copy.deepcopy(self.database_list[database_id])
+
+    def retrieve_page(self, page_id):
+        self.page_calls.append(page_id)
+        return copy.deepcopy(self.page_list[page_id])
+
+
+@pytest.fixture
+def notion(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SNAPSHOT_ENABLED", True)
+    monkeypatch.setattr(settings, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "SELLER_NAME_CACHE_PATH", str(tmp_path / "seller_names.json"))
+    monkeypatch.setattr(settings, "FULL_SYNC_HOURS", 24.0)
+    monkeypatch.setattr(settings, "NOTION_MAX_WORKERS", 2)
+    monkeypatch.setattr(shared_rate_limiter, "rate", 0)
+
+    fake = FakeNotion()
+    fake.add_database("db-ana", "Ana", [
+        make_entry("ana-1", "Lead 1", "ABORDAGEM 1"),
+        make_entry("ana-2", "Lead 2", "CONVERSANDO"),
+        make_entry("ana-3", "Lead 3", "NEGOCIANDO"),
+    ])
+    fake.add_database("db-bruno", "Bruno", [
+        make_entry("bruno-1", "Lead 4", "ABORDAGEM 1"),
+        make_entry("bruno-2", "Lead 5", "VENDA"),
+    ])
+    return fake
+
+
+def make_processor(fake):
+    processor = DataProcessor()
+    processor.notion_client.client = fake
+    return processor
+
+
+def statuses(df):
+    return df.set_index("lead_id")["status"].to_dict()
+
+
+def test_concurrent_load_matches_serial_load(notion):
+    for seller in ["Carla", "Diego", "Elisa", "Fabio"]:
+        database_id = f"db-{seller.lower()}"
+        notion.add_database(database_id, seller, [
+            make_entry(f"{database_id}-{n}", f"Lead {seller} {n}", status)
+            for n, status in enumerate(["ABORDAGEM 1", "CONVERSANDO", "VENDA"])
+        ])
+
+    serial = make_processor(notion).get_all_sales_data(max_workers=1)
+    concurrent = make_processor(notion).get_all_sales_data(max_workers=4)
+
+    assert serial["vendedor"].nunique() == 6
+    assert_frame_equal(serial, concurrent)
+
+
+def test_request_stats_count_only_the_latest_load(notion):
+    processor = make_processor(notion)
+    processor.get_all_sales_data()
+    first = processor.notion_client.get_request_stats()
+
+    processor.get_all_sales_data()
+    second = processor.notion_client.get_request_stats()
+
+    assert 0 < second["requests"] <= first["requests"]
+
+
+def test_incremental_sync_merges_edited_leads(notion):
+    processor = make_processor(notion)
+    processor.get_all_sales_data(incremental=True)
+
+    notion.edit("db-ana", make_entry("ana-2", "Lead 2", "VENDA", EDITED_LATER))
+    notion.query_calls.clear()
+    df = processor.get_all_sales_data(incremental=True)
+
+    assert notion.query_calls == ["db-ana"]
+    assert processor.unchanged_databases == ["db-bruno"]
+    assert statuses(df)["ana-2"] == "VENDA"
+    assert len(df) == 5
+
+
+def test_schema_change_reextracts_every_lead(notion):
+    processor = make_processor(notion)
+    processor.get_all_sales_data(incremental=True)
+    notion.edit("db-ana", make_entry("ana-1", "Lead 1", "VENDA", EDITED_LATER))
+    processor.get_all_sales_data(incremental=True)
+
+    # Renomear não muda o last_edited_time das entradas
+    notion.rename_property("db-ana", "Telefone", "Observacao", edited="2024-02-02T10:00:00.000Z")
+    df = processor.get_all_sales_data(incremental=True)
+
+    ana = df[df["vendedor"] == "Ana"].set_index("lead_id")["telefone"].to_dict()
+    assert ana == {"ana-1": "", "ana-2": "", "ana-3": ""}
+    assert df.equals(make_processor(notion).get_all_sales_data(incremental=False))
+
+
+def test_archived_lead_leaves_on_scheduled_full_sync(notion):
+    processor = make_processor(notion)
+    processor.get_all_sales_data(incremental=True)
+
+    notion.archive("db-ana", "ana-3")
+    df = processor.get_all_sales_data(incremental=True)
+    # A consulta incremental não enxerga entradas arquivadas
+    assert "ana-3" in statuses(df)
+
+    processor.last_full_sync_at = time.time() - 25 * 3600
+    df = processor.get_all_sales_data(incremental=True)
+
+    assert "ana-3" not in statuses(df)
+    assert len(df) == 4
+    assert not processor.full_sync_due()
+
+
+def test_full_sync_schedule_survives_restart(notion):
+    make_processor(notion).get_all_sales_data(incremental=True)
+
+    restarted = make_processor(notion)
+    assert restarted.load_snapshot() is not None
+    assert not restarted.full_sync_due()
+
+    notion.edit("db-bruno", make_entry("bruno-1", "Lead 4", "VENDA", EDITED_LATER))
+    notion.query_calls.clear()
+    df = restarted.get_all_sales_data(incremental=True)
+
+    assert notion.query_calls == ["db-bruno"]
+    assert statuses(df)["bruno-1"] == "VENDA"
+
+
+def test_removed_database_is_pruned_on_resync(notion):
+    processor = make_processor(notion)
+    processor.get_all_sales_data(incremental=True)
+    raw_path = processor.snapshot_store._raw_path("db-bruno")
+    assert os.path.exists(raw_path)
+
+    del notion.database_list["db-bruno"]
+    df = processor.get_all_sales_data(incremental=True)
+
+    assert set(df["vendedor"]) == {"Ana"}
+    assert list(processor.database_cache) == ["db-ana"]
+    assert list(processor.snapshot_store.load_manifest()["databases"]) == ["db-ana"]
+    assert not os.path.exists(raw_path)
+
+
+def test_renamed_seller_shows_on_next_sync(notion):
+    processor = make_processor(notion)
+    processor.get_all_sales_data(incremental=True)
+
+    notion.rename("db-bruno", "Bruno Lima", edited=time.strftime(
+        "%Y-%m-%dT%H:%M:00.000Z", time.gmtime()))
+    notion.page_calls.clear()
+    df = processor.get_all_sales_data(incremental=True)
+
+    assert notion.page_calls == ["page-db-bruno"]
+    assert set(df["vendedor"]) == {"Ana", "Bruno Lima"}
+
+
+def test_long_edit_scan_refetches_seller_pages(notion, monkeypatch):
+    monkeypatch.setattr(settings, "SELLER_NAME_SCAN_MAX_PAGES", 0)
+    processor = make_processor(notion)
+    processor.get_all_sales_data(incremental=True)
+
+    notion.rename("db-bruno", "Bruno Lima", edited=time.strftime(
+        "%Y-%m-%dT%H:%M:00.000Z", time.gmtime()))
+    notion.page_calls.clear()
+    df = processor.get_all_sales_data(incremental=True)
+
+    assert sorted(notion.page_calls) == ["page-db-ana", "page-db-bruno"]
+    assert set(df["vendedor"]) == {"Ana", "Bruno Lima"}
+
+
+def test_stale_edit_check_skips_scan_and_refetches_seller_pages(notion, monkeypatch):
+    processor = make_processor(notion)
+    processor.get_all_sales_data(incremental=True)
+    processor.seller_resolver.changes_checked_at = time.time() - (settings.SELLER_NAME_TTL_HOURS + 1) * 3600
+
+    searches = []
+    search = notion.search
+    monkeypatch.setattr(notion, "search", lambda **kwargs: searches.append(kwargs) or search(**kwargs))
+    notion.page_calls.clear()
+    processor.get_all_sales_data(incremental=True)
+
+    assert all(kwargs["filter"]["value"] == "database" for kwargs in searches)
+    assert sorted(notion.page_calls) == ["page-db-ana", "page-db-bruno"]
+
+
+def test_partial_refresh_splices_one_database_in_search_order(notion, monkeypatch):
+    processor = make_processor(notion)
+    full = processor.get_all_sales_data(incremental=True)
+
+    gated = []
+    is_low_quality = processor.is_low_quality_database
+    monkeypatch.setattr(processor, "is_low_quality_database",
+                        lambda leads, vendedor: gated.append(vendedor) or is_low_quality(leads, vendedor))
+
+    notion.edit("db-ana", make_entry("ana-1", "Lead 1", "VENDA", EDITED_LATER))
+    df = processor.refresh_databases(vendedor="Ana")
+
+    assert gated == ["Ana"]
+    assert list(df["lead_id"]) == list(full["lead_id"])
+    assert statuses(df)["ana-1"] == "VENDA"
+
+
+def test_partial_refresh_reports_unreadable_database(notion, monkeypatch):
+    processor = make_processor(notion)
+    processor.get_all_sales_data(incremental=True)
+    cached = copy.deepcopy(processor.database_cache["db-ana"])
+
+    def retrieve(database_id):
+        raise RuntimeError("Notion fora do ar")
+
+    monkeypatch.setattr(notion.databases, "retrieve", retrieve)
+    notion.edit("db-ana", make_entry("ana-1", "Lead 1", "VENDA", EDITED_LATER))
+    with pytest.raises(ValueError, match="db-ana"):
+        processor.refresh_databases(vendedor="Ana")
+
+    assert processor.database_cache["db-ana"]["last_edited_time"] == cached["last_edited_time"]
@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from notion_client.errors import APIErrorCode, APIResponseError
+
+from config.settings import settings
+from services.notion_client import NotionClient, shared_rate_limiter
+
+RETRY_AFTER = 0.05
+
+
+def api_error(status, code, headers=None):
+    response = httpx.Response(status, headers=headers, request=httpx.Request("POST", "https://api.notion.com"))
+    return APIResponseError(response, f"HTTP {status}", code)
+
+
+def rate_limited():
+    return api_error(429, APIErrorCode.RateLimited, {"Retry-After": str(RETRY_AFTER)})
+
+
+def bad_gateway():
+    return api_error(502, APIErrorCode.InternalServerError)
+
+
+class FlakyQuery:
+    """databases.query com 3 páginas de resultados que falha conforme o roteiro
+
+    failures mapeia o número da chamada (a partir de 1) para a exceção
+    levantada nela; as demais chamadas devolvem a página do start_cursor.
+    """
+
+    pages = {
+        None: (["lead-1", "lead-2"], "cursor-2"),
+        "cursor-2": (["lead-3", "lead-4"], "cursor-3"),
+        "cursor-3": (["lead-5"], None),
+    }
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.cursors = []
+
+    def __call__(self, database_id, start_cursor=None, page_size=100, **kwargs):
+        self.cursors.append(start_cursor)
+        error = self.failures.get(len(self.cursors))
+        if error is not None:
+            raise error
+        lead_ids, next_cursor = self.pages[start_cursor]
+        return {
+            "results": [{"id": lead_id} for lead_id in lead_ids],
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor,
+        }
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    monkeypatch.setattr(settings, "NOTION_RETRY_BASE_DELAY", 0.01)
+    monkeypatch.setattr(settings, "NOTION_MAX_RETRIES", 3)
+    monkeypatch.setattr(shared_rate_limiter, "rate", 0)
+    # O 429 pausa o limitador compartilhado; não deixa a pausa para os outros testes
+    monkeypatch.setattr(shared_rate_limiter, "_tokens", shared_rate_limiter._tokens)
+
+    def make(query):
+        client = NotionClient()
+        client.client = SimpleNamespace(databases=SimpleNamespace(query=query))
+        return client
+
+    return make
+
+
+def lead_ids(client):
+    return [entry["id"] for page in client.iter_database_pages("db-ana") for entry in page]
+
+
+def test_pagination_resumes_from_last_cursor_after_429_and_502(make_client):
+    query = FlakyQuery({2: rate_limited(), 3: bad_gateway(), 5: bad_gateway()})
+    client = make_client(query)
+
+    assert lead_ids(client) == ["lead-1", "lead-2", "lead-3", "lead-4", "lead-5"]
+    assert query.cursors == [None, "cursor-2", "cursor-2", "cursor-2", "cursor-3", "cursor-3"]
+
+    stats = client.get_request_stats()
+    assert stats["requests"] == 6
+    assert stats["retries"] == 3
+    assert stats["rate_limited"] == 1
+    # Retry-After do 429 mais os backoffs dos 502 (até 0.02s e 0.01s)
+    assert RETRY_AFTER < stats["throttled_seconds"] <= RETRY_AFTER + 0.03
+
+
+def test_persistent_failure_propagates_after_pages_already_read(make_client):
+    query = FlakyQuery({call: bad_gateway() for call in range(2, 6)})
+    client = make_client(query)
+
+    pages = client.iter_database_pages("db-ana")
+    assert [entry["id"] for entry in next(pages)] == ["lead-1", "lead-2"]
+    with pytest.raises(APIResponseError):
+        next(pages)
+
+    assert query.cursors == [None] + ["cursor-2"] * 4
+    stats = client.get_request_stats()
+    assert stats["retries"] == 3
+    assert stats["rate_limited"] == 0
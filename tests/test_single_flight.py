@@ -0,0 +1,126 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from services.dataset_store import DatasetStore, FULL_REFRESH
+from services.single_flight import SingleFlight
+
+TIMEOUT = 5
+
+
+class WaitSpy:
+    """Substitui o Event de um Flight e avisa quando alguém começa a esperar"""
+
+    def __init__(self, event):
+        self.event = event
+        self.waiting = threading.Event()
+
+    def wait(self, timeout=None):
+        self.waiting.set()
+        return self.event.wait(timeout)
+
+    def set(self):
+        self.event.set()
+
+
+def start(fn):
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = fn()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def start_leader(flights, key, fn):
+    """Começa uma execução de key que só termina quando release for setado"""
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocked():
+        started.set()
+        assert release.wait(TIMEOUT)
+        return fn()
+
+    thread, outcome = start(lambda: flights.do(key, blocked))
+    assert started.wait(TIMEOUT)
+    spy = WaitSpy(flights.flights[key].done)
+    flights.flights[key].done = spy
+    return thread, outcome, release, spy
+
+
+def test_joiner_receives_leader_result():
+    flights = SingleFlight()
+    calls = []
+    leader, leader_outcome, release, spy = start_leader(
+        flights, "full", lambda: calls.append("leader") or "dados")
+
+    joiner, joiner_outcome = start(lambda: flights.do("full", lambda: calls.append("joiner")))
+    assert spy.waiting.wait(TIMEOUT)
+    release.set()
+    leader.join(TIMEOUT)
+    joiner.join(TIMEOUT)
+
+    assert calls == ["leader"]
+    assert leader_outcome == joiner_outcome == {"result": "dados"}
+    assert not flights.in_flight("full")
+
+
+def test_joiner_receives_leader_exception():
+    flights = SingleFlight()
+    error = RuntimeError("Notion fora do ar")
+
+    def fail():
+        raise error
+
+    leader, leader_outcome, release, spy = start_leader(flights, "full", fail)
+    joiner, joiner_outcome = start(lambda: flights.do("full", lambda: "não deveria rodar"))
+    assert spy.waiting.wait(TIMEOUT)
+    release.set()
+    leader.join(TIMEOUT)
+    joiner.join(TIMEOUT)
+
+    assert leader_outcome["error"] is error
+    assert joiner_outcome["error"] is error
+    assert not flights.in_flight("full")
+
+
+def test_key_is_released_after_success_and_exception():
+    flights = SingleFlight()
+
+    assert flights.do("full", lambda: 1) == 1
+    assert not flights.in_flight("full")
+
+    with pytest.raises(ZeroDivisionError):
+        flights.do("full", lambda: 1 / 0)
+    assert not flights.in_flight("full")
+
+    assert flights.do("full", lambda: 2) == 2
+
+
+def test_partial_refresh_joins_running_full_refresh():
+    store = DatasetStore()
+    full_dataset = SimpleNamespace()
+    partial_calls = []
+
+    leader, leader_outcome, release, spy = start_leader(
+        store.flights, FULL_REFRESH, lambda: store.load_and_publish(lambda: full_dataset))
+    partial, partial_outcome = start(lambda: store.refresh_partial(
+        ("seller", "Ana"), lambda: partial_calls.append("Ana") or SimpleNamespace()))
+    assert spy.waiting.wait(TIMEOUT)
+    assert store.refreshing()
+    release.set()
+    leader.join(TIMEOUT)
+    partial.join(TIMEOUT)
+
+    assert partial_calls == []
+    assert partial_outcome["result"] is full_dataset
+    assert store.current() is full_dataset and full_dataset.version == 1
+    assert not store.refreshing()
+    assert not store.flights.in_flight(("seller", "Ana"))